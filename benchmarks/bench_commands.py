@@ -0,0 +1,162 @@
+"""
+Benchmark the commands end to end against a local fake of the APIs.
+
+Every command runs in its own process against benchmarks/fake_api.py, with the response cache and page archive disabled.
+Each run reports its wall time, peak memory (max resident set size) and the number of requests per API, as JSON.
+Save the output of two commits and compare them to measure a change.
+
+Sizes mean, per command:
+
+- kwlist: keywords to collect (--cutoff)
+- competition: keywords to search
+- urlmap: semrush rows divided by 100
+- cluster: keywords to cluster divided by 10
+- onpage: secondary search terms (each one adds a serp and its pages)
+
+Usage:
+
+> python -m benchmarks.bench_commands [--commands NAME ...] [--sizes N ...] [--latency SECONDS] [--output FILEPATH]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from benchmarks.fake_api import FakeServer
+
+SEEDS = ["running shoes", "trail running", "marathon training", "running watch", "running clothes"]
+
+WORDS = ["best", "cheap", "women", "men", "review", "sale", "test", "beginners", "winter", "waterproof", "light", "wide", "kids", "2023"]
+
+
+def build_keywords(count: int) -> List[str]:
+    keywords = list()
+    for n in range(count):
+        seed = SEEDS[n % len(SEEDS)]
+        first = WORDS[(n // len(SEEDS)) % len(WORDS)]
+        second = WORDS[(n // (len(SEEDS) * len(WORDS))) % len(WORDS)]
+        keywords.append(f"{first} {seed} {second}" if n >= len(SEEDS) * len(WORDS) else f"{first} {seed}")
+    return keywords
+
+
+def run_kwlist(size: int, workdir: Path, site: str) -> None:
+    from src.kwlist import get_kwlist
+
+    get_kwlist(SEEDS[:2], "sweden", size, workdir / "kwlist.csv", [], 5, size * 10)
+
+
+def run_competition(size: int, workdir: Path, site: str) -> None:
+    from src.competition import enumerate_competition
+
+    lines = [f"{keyword},{100 * (n + 1)}" for n, keyword in enumerate(build_keywords(size))]
+    enumerate_competition(lines, "sweden", workdir / "competition.csv", True)
+
+
+def run_urlmap(size: int, workdir: Path, site: str) -> None:
+    from src.urlmap import map_domain
+
+    map_domain("example.com", "se", size * 100, None, workdir / "urlmap.csv", True, ["/accessories/", "headlamp"], 20)
+
+
+def run_cluster(size: int, workdir: Path, site: str) -> None:
+    from src.cluster import cluster_keywords
+
+    cluster_keywords(build_keywords(size * 10), 0.9, workdir / "cluster.csv", "numpy", 1, "affinity", 0.25, False, None)
+
+
+def run_onpage(size: int, workdir: Path, site: str) -> None:
+    from src.onpage import compile_onpage
+
+    compile_onpage(f"{site}/www.example.com/running-shoes", "running shoes", build_keywords(size), "sweden", workdir / "onpage.docx")
+
+
+COMMANDS: Dict[str, Callable[[int, Path, str], None]] = {
+    "kwlist": run_kwlist,
+    "competition": run_competition,
+    "urlmap": run_urlmap,
+    "cluster": run_cluster,
+    "onpage": run_onpage,
+}
+
+
+def peak_memory_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(command: str, size: int, base: str, site: str, result: Path) -> None:
+    from src.archive import configure_archive
+    from src.cache import configure_cache
+    from src.constants import ENDPOINTS
+
+    for api in ENDPOINTS:
+        ENDPOINTS[api] = base
+    configure_cache(False, False, 0)
+    configure_archive(False, False)
+    workdir = result.parent
+    start = time.perf_counter()
+    COMMANDS[command](size, workdir, site)
+    wall = time.perf_counter() - start
+    result.write_text(json.dumps({"wall_seconds": round(wall, 3), "peak_memory_mb": round(peak_memory_mb(), 1)}))
+
+
+def run_benchmark(server: FakeServer, command: str, size: int, verbose: bool) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as home:
+        result = Path(home) / "result.json"
+        environment = dict(os.environ, HOME=home, SEMRUSHKEY="bench", VALUESERPKEY="bench", PDTECHSEO="bench")
+        child = [sys.executable, "-m", "benchmarks.bench_commands", "--child", command, str(size), server.base, server.sites[0], str(result)]
+        before = server.snapshot()
+        process = subprocess.run(child, env=environment, stdout=None if verbose else subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        after = server.snapshot()
+        report: Dict[str, Any] = {"command": command, "size": size}
+        if process.returncode == 0 and result.exists():
+            report.update(json.loads(result.read_text()))
+        else:
+            report["error"] = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit code {process.returncode}"
+        report["requests"] = {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0)}
+    return report
+
+
+def get_commit() -> str:
+    process = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return process.stdout.strip() if process.returncode == 0 else ""
+
+
+def main() -> None:
+    if sys.argv[1:2] == ["--child"]:
+        command, size, base, site, result = sys.argv[2:7]
+        run_child(command, int(size), base, site, Path(result))
+        return
+    parser = argparse.ArgumentParser(description="Benchmark the commands end to end against a local fake of the APIs.")
+    parser.add_argument("--commands", type=str, nargs="*", choices=list(COMMANDS), default=list(COMMANDS), help="commands to run (default = all)")
+    parser.add_argument("--sizes", type=int, metavar="N", nargs="*", default=[10, 50], help="input sizes (default = 10 50)")
+    parser.add_argument("--latency", type=float, metavar="SECONDS", default=0.05, help="fake response latency (default = 0.05)")
+    parser.add_argument("--sites", type=int, metavar="N", default=10, help="fake competitor sites (default = 10)")
+    parser.add_argument("--output", type=Path, metavar="FILEPATH", help="also write the report to a file")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the commands (default = false)")
+    arguments = parser.parse_args()
+    server = FakeServer(arguments.latency, arguments.sites)
+    results = list()
+    try:
+        for command in arguments.commands:
+            for size in arguments.sizes:
+                results.append(run_benchmark(server, command, size, arguments.verbose))
+                print(json.dumps(results[-1]), file=sys.stderr)
+    finally:
+        server.close()
+    report = {"commit": get_commit(), "python": sys.version.split()[0], "latency": arguments.latency, "results": results}
+    print(json.dumps(report, indent=2))
+    if arguments.output:
+        arguments.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark the --remove exclusion filter.
+
+Compares the previous filter, which joined the raw terms into one regex and ran str.contains over every row, with the compiled trie pattern of src.filtering.
+Both filters are checked to drop the same rows, the terms are plain words so the raw regex and the literal match agree.
+
+Usage:
+
+> python -m benchmarks.bench_filtering [--rows N] [--terms N] [--repeat N]
+"""
+
+import argparse
+import json
+import random
+import string
+import time
+from typing import Callable, List
+
+import pandas as pd
+
+from src.filtering import compile_exclusions, exclude_rows
+
+
+def random_word(generator: random.Random) -> str:
+    return "".join(generator.choices(string.ascii_lowercase, k=generator.randint(3, 9)))
+
+
+def build_data(rows: int, vocabulary: List[str], generator: random.Random) -> pd.DataFrame:
+    keywords = [" ".join(generator.choices(vocabulary, k=generator.randint(1, 4))) for _ in range(rows // 4)]
+    paths = ["/" + "/".join(generator.choices(vocabulary, k=2)) + "/" for _ in range(rows // 20)]
+    return pd.DataFrame({"keyword": generator.choices(keywords, k=rows), "url": ["https://example.com" + i for i in generator.choices(paths, k=rows)]})
+
+
+def previous_filter(data: pd.DataFrame, cut: List[str]) -> pd.DataFrame:
+    regex_paths = "|".join([i.replace("/", "") for i in cut if "/" in i])
+    regex_keywords = "|".join([i for i in cut if "/" not in i])
+    if regex_paths:
+        data = data.loc[~data["url"].str.contains(regex_paths)]
+    if regex_keywords:
+        data = data.loc[~data["keyword"].str.contains(regex_keywords)]
+    return data
+
+
+def timed(function: Callable[[], pd.DataFrame], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the --remove exclusion filter.")
+    parser.add_argument("--rows", type=int, metavar="N", default=500000, help="rows in the synthetic report (default = 500000)")
+    parser.add_argument("--terms", type=int, metavar="N", default=300, help="exclusion terms (default = 300)")
+    parser.add_argument("--repeat", type=int, metavar="N", default=3, help="runs per implementation (default = 3)")
+    arguments = parser.parse_args()
+    generator = random.Random(0)
+    vocabulary = [random_word(generator) for _ in range(20000)]
+    data = build_data(arguments.rows, vocabulary, generator)
+    terms = generator.sample(vocabulary, arguments.terms)
+    cut = terms[: arguments.terms // 10] + [f"/{i}/" for i in terms[arguments.terms // 10 :]]
+    expected = previous_filter(data, cut)
+    result = exclude_rows(data, compile_exclusions(cut))
+    if not expected.index.equals(result.index):
+        raise SystemExit("filters disagree on the excluded rows")
+    previous = timed(lambda: previous_filter(data, cut), arguments.repeat)
+    current = timed(lambda: exclude_rows(data, compile_exclusions(cut)), arguments.repeat)
+    report = {"rows": len(data), "terms": len(cut), "kept_rows": len(result), "previous_seconds": previous, "current_seconds": current, "speedup": previous / current}
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark the command line startup time.
+
+Runs the command line with python -X importtime and sums the time spent importing modules.
+Fails when a command goes over its import time budget, or when it imports a module it should not need (e.g., scikit-learn for --version).
+
+The pagemeta command runs with --offline and a temporary home directory, so it reads an empty page archive and makes no requests.
+
+Usage:
+
+> python -m benchmarks.bench_importtime [--repeat N] [--version-budget MS] [--pagemeta-budget MS]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Set, Tuple
+
+HEAVY_MODULES = ["numpy", "pandas", "scipy", "sklearn", "docx"]
+
+COMMANDS = {
+    "version": (["--version"], HEAVY_MODULES + ["lxml", "requests"]),
+    "pagemeta": (["pagemeta", "https://example.com", "--offline"], HEAVY_MODULES),
+}
+
+
+def measure_imports(arguments: List[str], home: str) -> Tuple[float, Set[str]]:
+    command = [sys.executable, "-X", "importtime", "-m", "src.cli"] + arguments
+    environment = dict(os.environ, HOME=home)
+    process = subprocess.run(command, capture_output=True, text=True, env=environment)
+    total = 0
+    modules = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:") :].split("|")
+        total += int(fields[0])
+        modules.add(fields[2].strip().split(".")[0])
+    return total / 1000, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the command line startup time.")
+    parser.add_argument("--repeat", type=int, metavar="N", default=5, help="runs per command, the fastest one counts (default = 5)")
+    parser.add_argument("--version-budget", type=float, metavar="MS", default=100.0, help="import time budget for --version (default = 100)")
+    parser.add_argument("--pagemeta-budget", type=float, metavar="MS", default=400.0, help="import time budget for pagemeta (default = 400)")
+    arguments = parser.parse_args()
+    budgets = {"version": arguments.version_budget, "pagemeta": arguments.pagemeta_budget}
+    report: Dict[str, Dict[str, object]] = dict()
+    failures = list()
+    with tempfile.TemporaryDirectory() as home:
+        for name, (command, forbidden) in COMMANDS.items():
+            runs = [measure_imports(command, home) for _ in range(arguments.repeat)]
+            milliseconds = min(i[0] for i in runs)
+            unexpected = sorted(set(forbidden) & runs[0][1])
+            report[name] = {"import_ms": round(milliseconds, 1), "budget_ms": budgets[name], "unexpected_modules": unexpected}
+            if milliseconds > budgets[name]:
+                failures.append(f"{name} imports take {milliseconds:.1f}ms, over the {budgets[name]:.0f}ms budget")
+            if unexpected:
+                failures.append(f"{name} imports {', '.join(unexpected)}")
+    print(json.dumps(report))
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
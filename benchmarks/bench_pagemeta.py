@@ -0,0 +1,86 @@
+"""
+Benchmark page metadata extraction.
+
+Compares the previous extraction, which parsed the page once per field (17 parses), with the extraction of src.onpage.
+The page is streamed into the parser in the chunks a fetch reads, then walked once, as the commands do it.
+
+Usage:
+
+> python -m benchmarks.bench_pagemeta [--paragraphs N] [--repeat N]
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict
+
+import lxml.html
+
+from src.onpage import PAGE_CHUNK_BYTES, configure_fetching, extract_metadata, parse_chunks
+
+
+def build_page(paragraphs: int) -> bytes:
+    head = (
+        "<head><title>Example page</title>"
+        "<meta name='description' content='An example page'><meta name='robots' content='index, follow'>"
+        "<link rel='canonical' href='https://example.com/'><link rel='alternate' hreflang='sv' href='https://example.com/sv/'>"
+        "<script type='application/ld+json'>{\"@type\": \"Organization\"}</script></head>"
+    )
+    sections = list()
+    for i in range(paragraphs):
+        sections.append(f"<h2>Section {i}</h2><p>Paragraph {i} with <a href='/page-{i}'>a link</a> and some text.</p><img src='/image-{i}.png'>")
+    return f"<html>{head}<body><h1>Example</h1>{''.join(sections)}</body></html>".encode("utf-8")
+
+
+def previous_metadata(content: bytes) -> Dict[str, Any]:
+    def xpath(query: str) -> Any:
+        return lxml.html.fromstring(content).xpath(query)
+
+    def stripped(query: str) -> str:
+        return " ".join([i.strip() for i in xpath(query)])
+
+    text = stripped("//title//text()") + stripped(".//h1//text()") + stripped("//h2//text()") + " ".join(xpath("//p//text()"))
+    return {
+        "titles": [i.strip() for i in xpath("//title//text()")],
+        "descriptions": [i.strip() for i in xpath("//meta[@name='description']/@content")],
+        "h1s": [i.strip() for i in xpath(".//h1//text()")],
+        "h2s": [i.strip() for i in xpath("//h2//text()")],
+        "canonical": xpath("//link[@rel='canonical']/@href"),
+        "alternate_links": xpath("//link[@rel='alternate']/@href"),
+        "hreflang": xpath("//link[@rel='alternate']/@hreflang"),
+        "links": xpath("//@href"),
+        "image_links": xpath("//img/@src"),
+        "meta_robots": xpath("//meta[@name='robots']/@content"),
+        "json_ld": xpath("//script[@type='application/ld+json']//text()"),
+        "wordcount": len(text.split()),
+    }
+
+
+def current_metadata(content: bytes) -> Dict[str, Any]:
+    chunks = (content[i : i + PAGE_CHUNK_BYTES] for i in range(0, len(content), PAGE_CHUNK_BYTES))
+    _, document, _ = parse_chunks(chunks, None, False)
+    return extract_metadata(document)
+
+
+def timed(function: Callable[[bytes], Any], content: bytes, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(content)
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark page metadata extraction.")
+    parser.add_argument("--paragraphs", type=int, metavar="N", default=500, help="paragraphs in the synthetic page (default = 500)")
+    parser.add_argument("--repeat", type=int, metavar="N", default=20, help="runs per implementation (default = 20)")
+    arguments = parser.parse_args()
+    content = build_page(arguments.paragraphs)
+    configure_fetching(len(content))
+    previous = timed(previous_metadata, content, arguments.repeat)
+    current = timed(current_metadata, content, arguments.repeat)
+    result = {"page_bytes": len(content), "previous_seconds": previous, "current_seconds": current, "speedup": previous / current}
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Local fake of the APIs and websites the commands talk to.
+
+Replays the recorded fixtures in benchmarks/fixtures with a configurable latency:
+
+- valueserp.json for ValueSERP searches, with the query substituted and the organic results shuffled per query
+- semrush.csv for SEMrush domain reports, repeated (with numbered keywords) to fill any number of rows
+- page.html for every page, served from a few local "sites" (one port each) so the per host limits apply as they would live
+
+Account and health check endpoints answer with fixed payloads, and every request is counted per route.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures"
+
+SEMRUSH_REPORT_ROWS = 1000000
+
+
+class FakeServer:
+    def __init__(self, latency: float, sites: int) -> None:
+        self.latency = latency
+        self.requests: Counter[str] = Counter()
+        self.lock = threading.Lock()
+        self.valueserp = (FIXTURES_PATH / "valueserp.json").read_text(encoding="utf-8")
+        self.semrush = (FIXTURES_PATH / "semrush.csv").read_text(encoding="utf-8").splitlines()
+        self.page = (FIXTURES_PATH / "page.html").read_bytes()
+        self.servers = [ThreadingHTTPServer(("127.0.0.1", 0), self.handler()) for _ in range(sites + 1)]
+        for server in self.servers:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    @property
+    def base(self) -> str:
+        return f"http://127.0.0.1:{self.servers[0].server_address[1]}"
+
+    @property
+    def sites(self) -> List[str]:
+        return [f"http://127.0.0.1:{i.server_address[1]}" for i in self.servers[1:]]
+
+    def count(self, route: str) -> None:
+        with self.lock:
+            self.requests[route] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.requests)
+
+    def close(self) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def search(self, query: str) -> bytes:
+        slug = re.sub(r"\W+", "-", query.lower()).strip("-")
+        text = self.valueserp.replace("{q}", json.dumps(query)[1:-1]).replace("{slug}", slug)
+        data = json.loads(text)
+        results = data["organic_results"]
+        random.Random(zlib.crc32(query.encode("utf-8"))).shuffle(results)
+        sites = self.sites
+        for position, result in enumerate(results, start=1):
+            result["position"] = position
+            result["link"] = f"{sites[position % len(sites)]}/{urlparse(result['link']).netloc}/{slug}"
+        return json.dumps(data).encode("utf-8")
+
+    def report(self, rows: int, offset: int) -> bytes:
+        header, recorded = self.semrush[0], self.semrush[1:]
+        if offset >= SEMRUSH_REPORT_ROWS:
+            return b"ERROR 50 :: NOTHING FOUND"
+        lines = [header]
+        for n in range(offset, min(offset + rows, SEMRUSH_REPORT_ROWS)):
+            keyword, url, position, volume = recorded[n % len(recorded)].split(";")
+            repeat = n // len(recorded)
+            lines.append(f"{keyword} {repeat};{url}{repeat}/;{position};{volume}" if repeat else recorded[n % len(recorded)])
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def respond(self, path: str, query: Dict[str, List[str]]) -> Tuple[str, str, bytes]:
+        # returns the route (for the request counts), the content type and the body
+        if path == "/search":
+            return "valueserp", "application/json", self.search(query["q"][0])
+        if path == "/account":
+            return "valueserp_account", "application/json", json.dumps({"account_info": {"monthly_credits_remaining": 10**9}}).encode("utf-8")
+        if path == "/" and query.get("type") == ["domain_organic"]:
+            return "semrush", "text/csv", self.report(int(query["display_limit"][0]), int(query.get("display_offset", ["0"])[0]))
+        if path == "/users/countapiunits.html":
+            return "semrush_units", "text/plain", str(10**9).encode("utf-8")
+        if path.endswith("/runPagespeed"):
+            return "pagespeed", "application/json", json.dumps({"lighthouseResult": {"categories": {"performance": {"score": 0.87}}}}).encode("utf-8")
+        if path.endswith("mobileFriendlyTest:run"):
+            return "searchconsole", "application/json", json.dumps({"mobileFriendliness": "MOBILE_FRIENDLY"}).encode("utf-8")
+        return "pages", "text/html; charset=utf-8", self.page
+
+    def handler(self) -> type:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def reply(self) -> None:
+                parsed = urlparse(self.path)
+                route, content_type, body = fake.respond(parsed.path, parse_qs(parsed.query))
+                fake.count(route)
+                time.sleep(fake.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                self.reply()
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.reply()
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
@@ -1,6 +1,10 @@
+import re
+
 from setuptools import find_packages, setup
 
-from src.cli import semver
+# read the version from the source, importing src.cli would import its dependencies before they are installed
+with open("src/cli.py") as f:
+    semver = re.findall(r'^semver = "(.+)"$', f.read(), re.MULTILINE)[0]
 
 with open("requirements.txt") as f:
     required = f.read().splitlines()
@@ -12,6 +16,6 @@ setup(
     description="common seo operations",
     author="wttrz",
     install_requires=required,
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     entry_points={"console_scripts": ["serene=src.cli:main"]},
 )
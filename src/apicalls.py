@@ -8,26 +8,30 @@ References:
 """
 
 import sys
-from typing import Any
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional
 
 import requests
 
-from src.authentication import get_api_credit, get_api_key
-from src.constants import VALUESERP_LOCATIONS
+from src.authentication import get_api_key, spend_api_credit
+from src.cache import get_cached, set_cached
+from src.concurrency import request_with_retries, run_blocking, run_concurrently, single_flight
+from src.constants import ENDPOINTS, VALUESERP_LOCATIONS
 from src.formatting import fprint
+from src.profiling import count, span
+from src.transport import get_session
 
-session = requests.Session()
+SEMRUSH_PAGE_ROWS = 5000
 
+SEMRUSH_PAGES_IN_FLIGHT = 4
 
-def query_valueserp(term: str, location: str) -> requests.Response:
-    get_api_credit("valueserp")
-    api_key = get_api_key("valueserp")
+
+def valueserp_parameters(term: str, location: str) -> Dict[str, str]:
     locale = VALUESERP_LOCATIONS.get(location.title())
     if not locale:
         locales = ", ".join(list(VALUESERP_LOCATIONS.keys()))
         fprint("error", f"unsupported location, try any of {locales}")
         sys.exit()
-    endpoint = f"https://api.valueserp.com/search?api_key={api_key}"
     domain = locale[0] if locale else "google.se"
     country = locale[1] if locale else "se"
     language = locale[2] if locale else "sv"
@@ -40,30 +44,104 @@ def query_valueserp(term: str, location: str) -> requests.Response:
         "output": "json",
         "flatten_results": "true",
     }
-    return session.get(endpoint, params=parameters)
+    return parameters
 
 
-def query_semrush(domain: str, location: str, rows: int) -> requests.Response:
+def get_cached_valueserp(term: str, location: str) -> Optional[Dict[str, Any]]:
+    cached: Optional[Dict[str, Any]] = get_cached("valueserp", valueserp_parameters(term, location))
+    return cached
+
+
+async def fetch_valueserp(term: str, location: str) -> Dict[str, Any]:
+    parameters = valueserp_parameters(term, location)
+    cached: Optional[Dict[str, Any]] = get_cached("valueserp", parameters)
+    if cached is not None:
+        count("valueserp.cache_hits")
+        return cached
+    return await single_flight("valueserp", tuple(sorted(parameters.items())), partial(request_valueserp, term, parameters))
+
+
+async def request_valueserp(term: str, parameters: Dict[str, str]) -> Dict[str, Any]:
+    await run_blocking(spend_api_credit, "valueserp", 1)
+    api_key = get_api_key("valueserp")
+    endpoint = f"{ENDPOINTS['valueserp']}/search?api_key={api_key}"
+    with span("valueserp search", "api", q=term):
+        response = await request_with_retries("valueserp", lambda: get_session().get(endpoint, params=parameters))
+    count("valueserp.requests")
+    count("valueserp.bytes", len(response.content) if response is not None else 0)
+    if response is None or not response.ok:
+        fprint("warning", f"no serps collected for {term}")
+        return dict()
+    data: Dict[str, Any] = response.json()
+    set_cached("valueserp", parameters, data)
+    return data
+
+
+def collect_related(response: Dict[str, Any]) -> List[str]:
+    related = list()
+    if "related_searches" in response:
+        related.append([i["query"] for i in response["related_searches"]])
+    if "related_questions" in response:
+        related.append([i["question"] for i in response["related_questions"]])
+    return [i for sublist in related for i in sublist]
+
+
+def query_valueserp(term: str, location: str) -> Dict[str, Any]:
+    return run_concurrently([partial(fetch_valueserp, term, location)])[0]
+
+
+def query_valueserp_batch(terms: List[str], location: str) -> List[Dict[str, Any]]:
+    return run_concurrently([partial(fetch_valueserp, i, location) for i in terms])
+
+
+async def fetch_semrush(domain: str, location: str, rows: int, offset: int = 0) -> requests.Response:
     apikey = get_api_key("semrush")
-    get_api_credit("valueserp")
     database = location.lower()
     databases = ["se", "no", "dk", "fi", "uk", "us"]
     if database not in databases:
         fprint("error", f"unsupported location, try: {', '.join(databases)}")
         sys.exit()
-    url = f"https://api.semrush.com/?type=domain_organic&key={apikey}"
+    url = f"{ENDPOINTS['semrush']}/?type=domain_organic&key={apikey}"
     export_columns = f"&export_columns=Ph,Ur,Po,Nq&domain={domain}"
-    display = f"&display_sort=nq_desc&display_limit={rows}&database={database}"
+    display = f"&display_sort=nq_desc&display_limit={rows}&display_offset={offset}&database={database}"
     api_call = url + export_columns + display
-    return requests.get(api_call)
+    with span("semrush report", "api", domain=domain, offset=offset):
+        response = await request_with_retries("semrush", lambda: get_session().get(api_call))
+    count("semrush.requests")
+    count("semrush.bytes", len(response.content) if response is not None else 0)
+    if response is None:
+        fprint("error", f"could not connect to semrush for {domain}")
+        sys.exit()
+    # semrush charges the rows it returns, pages requested past the end of the report return none
+    returned = 0 if "NOTHING" in response.text else max(0, response.text.count("\n") - 1)
+    await run_blocking(spend_api_credit, "semrush", returned)
+    return response
+
+
+def query_semrush(domain: str, location: str, rows: int) -> requests.Response:
+    return run_concurrently([partial(fetch_semrush, domain, location, rows)])[0]
+
+
+def query_semrush_pages(domain: str, location: str, rows: int) -> Iterator[str]:
+    # pages of the report in order, a few requested at a time, stopping early once semrush runs out of rows
+    offsets = list(range(0, rows, SEMRUSH_PAGE_ROWS))
+    for start in range(0, len(offsets), SEMRUSH_PAGES_IN_FLIGHT):
+        window = offsets[start : start + SEMRUSH_PAGES_IN_FLIGHT]
+        calls = [partial(fetch_semrush, domain, location, min(SEMRUSH_PAGE_ROWS, rows - i), i) for i in window]
+        for offset, response in zip(window, run_concurrently(calls)):
+            yield response.text
+            if "NOTHING" in response.text or response.text.count("\n") < min(SEMRUSH_PAGE_ROWS, rows - offset):
+                return
 
 
 def query_pagespeed(url: str) -> Any:
     fprint("info", f"collecting lighthouse mobile pagespeed data for {url}")
     apikey = get_api_key("pd-tech-seo")
     payload = {"url": url, "key": apikey, "strategy": "mobile"}
-    endpoint = "https://www.googleapis.com/pagespeedonline/v5/runPagespeed"
-    response = session.get(endpoint, params=payload).json()
+    endpoint = f"{ENDPOINTS['pagespeed']}/pagespeedonline/v5/runPagespeed"
+    with span("pagespeed", "api", url=url):
+        response = get_session().get(endpoint, params=payload).json()
+    count("pagespeed.requests")
     return response["lighthouseResult"]["categories"]["performance"]["score"]
 
 
@@ -71,6 +149,8 @@ def query_mobile_friendliness(url: str) -> Any:
     fprint("info", f"collecting mobile friendliness data for {url}")
     apikey = get_api_key("pd-tech-seo")
     payload = {"url": url, "key": apikey}
-    endpoint = "https://searchconsole.googleapis.com/v1/urlTestingTools/mobileFriendlyTest:run"
-    response = session.post(endpoint, data=payload).json()
+    endpoint = f"{ENDPOINTS['searchconsole']}/v1/urlTestingTools/mobileFriendlyTest:run"
+    with span("mobile friendliness", "api", url=url):
+        response = get_session().post(endpoint, data=payload).json()
+    count("searchconsole.requests")
     return response["mobileFriendliness"]
@@ -0,0 +1,98 @@
+"""
+Local archive of fetched pages.
+
+Pages are stored by URL in a local SQLite database together with their status code, headers, ETag and Last-Modified values.
+Bodies are compressed and stored once per content hash, so identical pages (or a page that did not change) share a single copy.
+Archived pages are revalidated with conditional requests, and can be read without any network access in offline mode.
+
+References:
+
+> https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+> https://docs.python.org/3/library/sqlite3.html
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional
+
+ARCHIVE_PATH = Path("~/.cache/serene/pages.sqlite3").expanduser()
+
+settings: Dict[str, Any] = {"enabled": True, "offline": False}
+
+database: Dict[str, sqlite3.Connection] = dict()
+
+lock = threading.Lock()
+
+
+class ArchivedPage(NamedTuple):
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    truncated: bool
+
+
+def configure_archive(enabled: bool, offline: bool) -> None:
+    settings.update({"enabled": enabled or offline, "offline": offline})
+
+
+def get_connection() -> sqlite3.Connection:
+    if "connection" not in database:
+        ARCHIVE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(ARCHIVE_PATH, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS bodies (digest TEXT PRIMARY KEY, body BLOB)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, status INTEGER, headers TEXT, etag TEXT, modified TEXT, digest TEXT, truncated INTEGER, fetched REAL)"
+        )
+        database["connection"] = connection
+    return database["connection"]
+
+
+def get_archived(url: str) -> Optional[ArchivedPage]:
+    if not settings["enabled"]:
+        return None
+    with lock:
+        connection = get_connection()
+        row = connection.execute(
+            "SELECT pages.status, pages.headers, bodies.body, pages.truncated FROM pages JOIN bodies ON pages.digest = bodies.digest WHERE pages.url = ?",
+            (url,),
+        ).fetchone()
+    if not row:
+        return None
+    return ArchivedPage(row[0], json.loads(row[1]), zlib.decompress(row[2]), bool(row[3]))
+
+
+def get_validators(archived: Optional[ArchivedPage]) -> Dict[str, str]:
+    # request headers that let the server answer 304 not modified instead of sending the page again
+    if archived is None:
+        return dict()
+    validators = dict()
+    if "etag" in archived.headers:
+        validators["If-None-Match"] = archived.headers["etag"]
+    if "last-modified" in archived.headers:
+        validators["If-Modified-Since"] = archived.headers["last-modified"]
+    return validators
+
+
+def set_archived(url: str, status_code: int, headers: Dict[str, str], content: bytes, truncated: bool) -> None:
+    if not settings["enabled"] or settings["offline"]:
+        return
+    digest = hashlib.sha256(content).hexdigest()
+    etag = headers.get("etag")
+    modified = headers.get("last-modified")
+    with lock:
+        connection = get_connection()
+        previous = connection.execute("SELECT digest FROM pages WHERE url = ?", (url,)).fetchone()
+        if not connection.execute("SELECT 1 FROM bodies WHERE digest = ?", (digest,)).fetchone():
+            connection.execute("INSERT INTO bodies VALUES (?, ?)", (digest, zlib.compress(content)))
+        connection.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, status_code, json.dumps(headers), etag, modified, digest, int(truncated), time.time()),
+        )
+        if previous and previous[0] != digest:
+            connection.execute("DELETE FROM bodies WHERE digest = ? AND NOT EXISTS (SELECT 1 FROM pages WHERE digest = ?)", (previous[0], previous[0]))
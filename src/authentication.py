@@ -13,11 +13,24 @@ References:
 
 import os
 import sys
-from typing import Optional
-
-import requests
+import threading
+from typing import Dict, Optional
 
+from src.constants import ENDPOINTS
 from src.formatting import fprint
+from src.profiling import count, span
+from src.transport import get_session
+
+CREDIT_THRESHOLD = 1000
+
+CREDIT_REFRESH_CALLS = 500
+
+# credits per valueserp search and per semrush domain_organic row
+CREDIT_UNITS = {"valueserp": 1, "semrush": 10}
+
+credits: Dict[str, Dict[str, int]] = dict()
+
+credit_lock = threading.Lock()
 
 
 def get_api_key(api_name: str) -> Optional[str]:
@@ -36,20 +49,51 @@ def get_api_key(api_name: str) -> Optional[str]:
 
 def get_api_credit(api_name: str) -> int:
     apikey = get_api_key(api_name)
+    count(f"{api_name}.credit_checks")
     if api_name == "semrush":
-        endpoint = "http://www.semrush.com/users/countapiunits.html"
+        endpoint = f"{ENDPOINTS['semrush_units']}/users/countapiunits.html"
         params = {"key": apikey}
-        r = requests.get(endpoint, params)
+        with span("credit check", "api", api=api_name):
+            r = get_session().get(endpoint, params=params)
         credit = int(r.text)
     if api_name == "valueserp":
-        endpoint = "https://api.valueserp.com/account"
+        endpoint = f"{ENDPOINTS['valueserp']}/account"
         params = {"api_key": apikey}
-        r = requests.get(endpoint, params)
+        with span("credit check", "api", api=api_name):
+            r = get_session().get(endpoint, params=params)
         r_dict = r.json()
         credit = r_dict["account_info"]["monthly_credits_remaining"]
-    if credit < 1000:
+    if credit < CREDIT_THRESHOLD:
         fprint("error", "credt limit reached, contact seo team for more credits")
         sys.exit()
     else:
         fprint("info", f"{credit} credit points left for the {api_name} api")
     return credit
+
+
+def get_tracked_credit(api_name: str) -> Dict[str, int]:
+    # the balance is fetched once per run and every few hundred calls after that, in between it is decremented locally
+    state = credits.get(api_name)
+    if not state or state["calls"] >= CREDIT_REFRESH_CALLS:
+        state = {"balance": get_api_credit(api_name), "calls": 0}
+        credits[api_name] = state
+    return state
+
+
+def reserve_api_credit(api_name: str, calls: int) -> None:
+    planned = calls * CREDIT_UNITS[api_name]
+    with credit_lock:
+        state = get_tracked_credit(api_name)
+        if state["balance"] - planned < CREDIT_THRESHOLD:
+            fprint("error", f"this run needs up to {planned} {api_name} credits but only {state['balance']} are left")
+            sys.exit()
+
+
+def spend_api_credit(api_name: str, calls: int) -> None:
+    with credit_lock:
+        state = get_tracked_credit(api_name)
+        state["balance"] -= calls * CREDIT_UNITS[api_name]
+        state["calls"] += 1
+        if state["balance"] < CREDIT_THRESHOLD:
+            fprint("error", "credt limit reached, contact seo team for more credits")
+            sys.exit()
@@ -0,0 +1,100 @@
+"""
+Persistent cache for API responses.
+
+Responses are stored as compressed JSON in a local SQLite database, keyed by the request parameters.
+Entries expire after a configurable time to live, and the least recently used entries are evicted once the database grows past its size limit.
+
+References:
+
+> https://docs.python.org/3/library/sqlite3.html
+> https://www.sqlite.org/wal.html
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+CACHE_PATH = Path("~/.cache/serene/responses.sqlite3").expanduser()
+
+CACHE_TTL_HOURS = 168
+
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+settings: Dict[str, Any] = {"enabled": True, "refresh": False, "ttl": CACHE_TTL_HOURS * 3600}
+
+database: Dict[str, sqlite3.Connection] = dict()
+
+lock = threading.Lock()
+
+
+def configure_cache(enabled: bool, refresh: bool, ttl_hours: float) -> None:
+    settings.update({"enabled": enabled, "refresh": refresh, "ttl": ttl_hours * 3600})
+
+
+def get_connection() -> sqlite3.Connection:
+    if "connection" not in database:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(CACHE_PATH, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, namespace TEXT, created REAL, accessed REAL, size INTEGER, body BLOB)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        database["connection"] = connection
+    return database["connection"]
+
+
+def cache_key(namespace: str, parameters: Dict[str, str]) -> str:
+    serialized = json.dumps([namespace, parameters], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def get_cached(namespace: str, parameters: Dict[str, str]) -> Optional[Any]:
+    if not settings["enabled"] or settings["refresh"]:
+        return None
+    key = cache_key(namespace, parameters)
+    now = time.time()
+    with lock:
+        connection = get_connection()
+        row = connection.execute("SELECT created, body FROM responses WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        if now - row[0] > settings["ttl"]:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+    return json.loads(zlib.decompress(row[1]))
+
+
+def set_cached(namespace: str, parameters: Dict[str, str], data: Any) -> None:
+    if not settings["enabled"]:
+        return
+    key = cache_key(namespace, parameters)
+    body = zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    now = time.time()
+    with lock:
+        connection = get_connection()
+        connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", (key, namespace, now, now, len(body), body))
+        evict_cached(connection)
+
+
+def evict_cached(connection: sqlite3.Connection) -> None:
+    # drop expired entries first, then the least recently used ones until the cache is back under its size limit
+    connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - settings["ttl"],))
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= CACHE_MAX_BYTES:
+        return
+    excess = total - int(CACHE_MAX_BYTES * 0.9)
+    freed = 0
+    stale = list()
+    for key, size in connection.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+        stale.append((key,))
+        freed += size
+        if freed >= excess:
+            break
+    connection.executemany("DELETE FROM responses WHERE key = ?", stale)
@@ -2,94 +2,167 @@
 Command line interface.
 
 Command line interface for the application for use on the terminal.
+
+Command modules are only imported by the command that runs them, so that e.g., pagemeta does not load scikit-learn or pandas.
+Their docstrings (the command descriptions) are read from the source files without importing them.
 """
 
 import argparse
+import ast
+import atexit
 import pathlib
 import sys
 import uuid
 
-from src.cluster import __doc__ as cluster_doc
-from src.cluster import cluster_keywords
-from src.competition import __doc__ as comp_doc
-from src.competition import enumerate_competition
+from src.cache import CACHE_TTL_HOURS
+from src.constants import ENGINES, MAX_CONCURRENCY, METHODS, PAGE_MAX_BYTES
 from src.formatting import fprint
-from src.kwlist import __doc__ as kwlist_doc
-from src.kwlist import get_kwlist
-from src.onpage import __doc__ as onpage_doc
-from src.onpage import compile_onpage, get_page_metadata
-from src.urlmap import __doc__ as urlmap_doc
-from src.urlmap import map_domain
+from src.profiling import configure_profiling, write_profile
 
 semver = "v0.0.4"
 
 
+def get_module_doc(module: str) -> str:
+    fpath = pathlib.Path(__file__).parent / f"{module}.py"
+    return ast.get_docstring(ast.parse(fpath.read_text(encoding="utf-8"))) or ""
+
+
 def get_arguments() -> argparse.Namespace:
 
     rfile = argparse.FileType("r", encoding="utf-8")
     # defaulthelp = argparse.ArgumentDefaultsHelpFormatter
     rawdesc = argparse.RawDescriptionHelpFormatter
 
+    serps = argparse.ArgumentParser(add_help=False)
+    serps.add_argument("--no-cache", action="store_false", dest="cache", help="do not read or store cached serps (default = false)")
+    serps.add_argument("--refresh", action="store_true", help="query fresh serps and update the cache (default = false)")
+    serps.add_argument("--cache-ttl", type=float, metavar="HOURS", default=CACHE_TTL_HOURS, help=f"cached serps lifetime (default = {CACHE_TTL_HOURS})")
+
+    pages = argparse.ArgumentParser(add_help=False)
+    pages.add_argument("--offline", action="store_true", help="read pages from the local page archive and serps from the response cache only, skip health checks (default = false)")
+    pages.add_argument("--no-archive", action="store_false", dest="archive", help="do not read or store archived pages (default = false)")
+    pages.add_argument("--max-bytes", type=int, metavar="N", default=PAGE_MAX_BYTES, help=f"bytes to read per page (default = {PAGE_MAX_BYTES})")
+
     parser = argparse.ArgumentParser(description="SEO Operations.")
     parser.add_argument("--version", action="version", version=semver)
+    parser.add_argument("--max-concurrency", type=int, metavar="N", default=MAX_CONCURRENCY, help=f"ceiling on requests in flight (default = {MAX_CONCURRENCY})")
+    parser.add_argument("--profile", action="store_true", help="time the run and write a chrome trace of it to the desktop (default = false)")
     subparsers = parser.add_subparsers(help="commands", dest="command")
 
     pagemeta_doc = "Fetch page metadata for a URL."
-    pagemeta = subparsers.add_parser("pagemeta", formatter_class=rawdesc, description=pagemeta_doc, help="fetch page metadata")
+    pagemeta = subparsers.add_parser("pagemeta", parents=[pages], formatter_class=rawdesc, description=pagemeta_doc, help="fetch page metadata")
     pagemeta.add_argument("url", type=str, help="url to inspect")
+    pagemeta.add_argument("--head-only", action="store_true", help="only read the <head> metadata (default = false)")
 
-    cluster = subparsers.add_parser(name="cluster", formatter_class=rawdesc, description=cluster_doc, help="cluster search terms")
+    cluster = subparsers.add_parser(name="cluster", formatter_class=rawdesc, description=get_module_doc("cluster"), help="cluster search terms")
     cluster.add_argument("file", type=rfile, help="keywords file (.txt or .csv) - should not contain header row")
     cluster.add_argument("--damping", type=float, metavar="N", default=0.9, help="damping factor (default = 0.9)")
-
-    competition = subparsers.add_parser(name="competition", formatter_class=rawdesc, description=comp_doc, help="find competing domains")
+    cluster.add_argument("--engine", type=str, choices=ENGINES, default="numpy", help="distance engine (default = numpy)")
+    cluster.add_argument("--jobs", type=int, metavar="N", default=1, help="number of processes computing distances (default = 1)")
+    cluster.add_argument("--memmap", action="store_true", help="keep distances in a file on disk while computing (default = false)")
+    cluster.add_argument("--update", type=rfile, metavar="FILEPATH", help="previous cluster output file to add the keywords to")
+    cluster.add_argument("--method", type=str, choices=METHODS, default="affinity", help="clustering method (default = affinity)")
+    cluster.add_argument("--threshold", type=float, metavar="N", default=0.25, help="relative distance threshold for graph method links and --update exemplar matches (default = 0.25)")
+
+    competition = subparsers.add_parser(name="competition", parents=[serps], formatter_class=rawdesc, description=get_module_doc("competition"), help="find competing domains")
     competition.add_argument("file", type=rfile, help="keyword file (.txt or .csv) - should not contain header row")
     competition.add_argument("--location", type=str, metavar="COUNTRY", default="sweden", help="location (default = sweden)")
+    competition.add_argument("--visibility", action="store_true", help="score domains by position and search volume (default = false)")
 
-    kwlist = subparsers.add_parser(name="kwlist", formatter_class=rawdesc, description=kwlist_doc, help="create a keyword list")
+    kwlist = subparsers.add_parser(name="kwlist", parents=[serps], formatter_class=rawdesc, description=get_module_doc("kwlist"), help="create a keyword list")
     kwlist.add_argument("file", type=rfile, metavar="PATH", help="keywords file (.txt or .csv) - should not contain header row")
     kwlist.add_argument("--location", type=str, metavar="COUNTRY", default="sweden", help="location (default = sweden)")
     kwlist.add_argument("--cutoff", type=int, metavar="N", default=50, help="cutoff point (default = 50)")
     kwlist.add_argument("--remove", type=str, metavar="TERM", nargs="*", help="discard patterns")
+    kwlist.add_argument("--max-depth", type=int, metavar="N", default=5, help="maximum expansion depth (default = 5)")
+    kwlist.add_argument("--max-requests", type=int, metavar="N", default=500, help="maximum number of searches (default = 500)")
 
-    urlmap = subparsers.add_parser(name="urlmap", formatter_class=rawdesc, description=urlmap_doc, help="map queries to pages")
+    urlmap = subparsers.add_parser(name="urlmap", formatter_class=rawdesc, description=get_module_doc("urlmap"), help="map queries to pages")
     urlmap.add_argument("domain", type=str, help="domain to map")
     urlmap.add_argument("--remove", type=str, metavar="TERM", nargs="*", help="discard patterns ('/subfolder/' or 'term')")
     urlmap.add_argument("--location", type=str, metavar="CODE", default="se", help="semrush database country code (default = se)")
     urlmap.add_argument("--rows", type=int, metavar="N", default=30, help="output rows (default = 30)")
     urlmap.add_argument("--file", type=rfile, metavar="FILEPATH", help="keyword file (.txt or .csv) - should not contain header row")
+    urlmap.add_argument("--max-position", type=int, metavar="N", default=20, help="lowest ranking position to map (default = 20)")
     urlmap.add_argument("--no-semrush", action="store_false", help="remove semrush data from output (default = false)")
 
-    onpage = subparsers.add_parser(name="onpage", formatter_class=rawdesc, description=onpage_doc, help="on page optimization")
-    onpage.add_argument("url", type=str, help="url to optimize")
-    onpage.add_argument("term", type=str, help="main search term to optimize")
+    onpage = subparsers.add_parser(name="onpage", parents=[serps, pages], formatter_class=rawdesc, description=get_module_doc("onpage"), help="on page optimization")
+    onpage.add_argument("url", type=str, nargs="?", help="url to optimize")
+    onpage.add_argument("term", type=str, nargs="?", help="main search term to optimize")
+    onpage.add_argument("--file", type=rfile, metavar="FILEPATH", help="briefs file (.csv) with url,term,terms rows - should not contain header row")
     onpage.add_argument("--terms", type=str, metavar="TERM", nargs="*", help="secondary search terms")
     onpage.add_argument("--location", type=str, metavar="COUNTY", default="sweden", help="location (default = sweden)")
 
+    moa = subparsers.add_parser(name="moa", parents=[serps, pages], formatter_class=rawdesc, description=get_module_doc("moa"), help="run kwlist to onpage as a job")
+    moa.add_argument("file", type=rfile, metavar="PATH", help="seed keywords file (.txt or .csv) - should not contain header row")
+    moa.add_argument("domain", type=str, help="domain to map the keywords to")
+    moa.add_argument("--job", type=str, metavar="DIRECTORY", help="job directory to resume (default = new job)")
+    moa.add_argument("--location", type=str, metavar="COUNTRY", default="sweden", help="location (default = sweden)")
+    moa.add_argument("--database", type=str, metavar="CODE", default="se", help="semrush database country code (default = se)")
+    moa.add_argument("--cutoff", type=int, metavar="N", default=50, help="keyword list cutoff point (default = 50)")
+    moa.add_argument("--max-requests", type=int, metavar="N", default=500, help="maximum number of keyword list searches (default = 500)")
+    moa.add_argument("--rows", type=int, metavar="N", default=10000, help="semrush rows (default = 10000)")
+    moa.add_argument("--remove", type=str, metavar="TERM", nargs="*", help="discard patterns ('/subfolder/' or 'term')")
+    moa.add_argument("--max-briefs", type=int, metavar="N", default=10, help="maximum number of briefs (default = 10)")
+
     return parser.parse_args()
 
 
 def main() -> None:
     arguments = get_arguments()
     uid = str(uuid.uuid4())
+    from src.concurrency import configure_concurrency, report_coalesced
+
+    configure_concurrency(arguments.max_concurrency)
+    atexit.register(report_coalesced)
+    if arguments.profile:
+        configure_profiling(True)
+        atexit.register(write_profile, pathlib.Path(f"~/Desktop/profile_{uid}.json").expanduser())
+    if arguments.command in ["competition", "kwlist", "onpage", "moa"]:
+        from src.cache import configure_cache
+
+        configure_cache(arguments.cache, arguments.refresh, arguments.cache_ttl)
+    if arguments.command in ["onpage", "pagemeta", "moa"]:
+        from src.archive import configure_archive
+        from src.onpage import configure_fetching
+
+        configure_fetching(arguments.max_bytes)
+        configure_archive(arguments.archive, arguments.offline)
     if arguments.command == "cluster":
+        from src.cluster import cluster_keywords
+
         keywords = arguments.file.read().splitlines()
         damping = arguments.damping
+        engine = arguments.engine
+        jobs = arguments.jobs
+        method = arguments.method
+        threshold = arguments.threshold
+        memmap = arguments.memmap
+        previous = arguments.update
         fpath = pathlib.Path(f"~/Desktop/cluster_{uid}.csv").expanduser()
-        cluster_keywords(keywords, damping, fpath)
+        cluster_keywords(keywords, damping, fpath, engine, jobs, method, threshold, memmap, previous)
     if arguments.command == "competition":
+        from src.competition import enumerate_competition
+
         keywords = arguments.file.read().splitlines()
         location = arguments.location.title()
+        visibility = arguments.visibility
         fpath = pathlib.Path(f"~/Desktop/competition_{uid}.csv").expanduser()
-        enumerate_competition(keywords, location, fpath)
+        enumerate_competition(keywords, location, fpath, visibility)
     if arguments.command == "kwlist":
+        from src.kwlist import get_kwlist
+
         keywords = arguments.file.read().splitlines()
         location = arguments.location
         cutoff = arguments.cutoff
         exclusions = arguments.remove
+        max_depth = arguments.max_depth
+        max_requests = arguments.max_requests
         fpath = pathlib.Path(f"~/Desktop/kwlist_{uid}.csv").expanduser()
-        get_kwlist(keywords, location, cutoff, fpath, exclusions)
+        get_kwlist(keywords, location, cutoff, fpath, exclusions, max_depth, max_requests)
     if arguments.command == "urlmap":
+        from src.urlmap import map_domain
+
         domain = arguments.domain
         database = arguments.location
         rows = arguments.rows
@@ -100,12 +173,25 @@ def main() -> None:
         if keep_semrush is False and not upload:
             fprint("error", "the --no-semrush option requires a --file FILEPATH")
             sys.exit()
-        map_domain(domain, database, rows, upload, fpath, keep_semrush, exclusions)
+        max_position = arguments.max_position
+        map_domain(domain, database, rows, upload, fpath, keep_semrush, exclusions, max_position)
     if arguments.command == "onpage":
+        from src.onpage import compile_onpage, compile_onpage_batch, read_briefs, strip_domain
+
         url = arguments.url
         term = arguments.term
         terms = arguments.terms
         location = arguments.location
+        if arguments.file:
+            briefs = read_briefs(arguments.file.read().splitlines())
+            fdir = pathlib.Path(f"~/Desktop/onpage_{uid}").expanduser()
+            fdir.mkdir(parents=True, exist_ok=True)
+            fpaths = [fdir / f"{n:03d}_{strip_domain(i[0])}.docx" for n, i in enumerate(briefs, start=1)]
+            compile_onpage_batch(briefs, location, fpaths)
+            return
+        if not url or not term:
+            fprint("error", "onpage requires a url and a term, or a --file FILEPATH")
+            sys.exit()
         # print("This operation is still a work in progress ...")
         # TODO: onpage check how to read the upload arguments to update the file
         # upload = arguments.file.read()
@@ -115,9 +201,18 @@ def main() -> None:
         compile_onpage(url, term, terms, location, fpath)
         # compile_onpage(url, term, terms, location, fpath)
         # create_brief(url, location, fpath)
+    if arguments.command == "moa":
+        from src.moa import run_job
+
+        seeds = arguments.file.read().splitlines()
+        job_dir = pathlib.Path(arguments.job or f"~/Desktop/moa_{uid}").expanduser()
+        exclusions = arguments.remove or []
+        run_job(seeds, arguments.domain, arguments.location, arguments.database, arguments.cutoff, arguments.max_requests, arguments.rows, exclusions, arguments.max_briefs, job_dir)
     if arguments.command == "pagemeta":
+        from src.onpage import get_page_metadata
+
         url = arguments.url
-        page_data = get_page_metadata(url)
+        page_data = get_page_metadata(url, arguments.head_only)
         print("\n")
         for k, v in page_data.items():
             print(f"\u001b[7m\033[4m\033[1m{k}\033[0m\n")
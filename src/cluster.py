@@ -13,27 +13,71 @@ It outputs a one-level clustering output that works on keyword lists in any lang
 A higher damping factor makes the algorithm slower but might increase cluster accuracy.
 The algorithm is not always perfect and might mislabel some keywords. Review the output.
 
+The distance matrix is symmetric, so only the upper triangle is computed and mirrored.
+The --engine option selects how the distances are computed:
+the numpy engine (default) runs the editing distance for thousands of keyword pairs at once,
+the python engine computes one pair at a time and is only kept as a reference implementation.
+
+The --jobs option splits the distance matrix into row blocks and computes them on several processes.
+Each process writes its rows straight into a memory-mapped matrix, the output is the same as with a single process.
+
+Distances are stored once per pair in the smallest integer type that fits them, usually a single byte.
+The --memmap option keeps them in a temporary file on disk instead of memory while they are computed.
+The similarity matrix used by Affinity Propagation is only built from them right before clustering.
+
+Affinity Propagation needs the distance between every pair of keywords, so memory and time grow with the square of the list.
+For very large lists (15k+ keywords) use --method graph instead.
+The graph method only compares keywords that share character trigrams, found with MinHash and locality sensitive hashing.
+Keywords whose editing distance is at most --threshold times the length of the longest of the two are linked.
+The keyword with the most similar neighbours becomes an exemplar and its linked keywords are covered, then the next uncovered keyword, and so on.
+Every keyword joins its most similar linked exemplar, so a cluster never chains keywords that are only linked through other keywords.
+A lower threshold creates smaller and stricter clusters.
+
+The --update option adds keywords to the clusters of a previous output file instead of starting over.
+Each new keyword joins the cluster of its closest exemplar when their editing distance is within the --threshold.
+Only the new keywords that are too far from every exemplar are clustered, with the selected method, into new clusters.
+
 References:
 
 > http://genes.toronto.edu/affinitypropagation/faq.html
 > https://en.wikipedia.org/wiki/Levenshtein_distance
 > https://blog.paperspace.com/implementing-levenshtein-distance-word-autocomplete-autocorrect/
+> http://infolab.stanford.edu/~ullman/mmds/ch3.pdf
 """
 
 import itertools
 import sys
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
 
 import numpy as np
 import pandas as pd
+from scipy.sparse import coo_matrix, csr_matrix
 from sklearn.cluster import AffinityPropagation
 
+from src.constants import ENGINES
 from src.formatting import fprint
+from src.profiling import span
+
+CHUNKSIZE = 2**16
+
+NGRAM = 3
+
+BANDS = 16
+
+BAND_ROWS = 2
+
+BUCKET_WINDOW = 64
+
+MEDIAN_CHUNKSIZE = 2**24
+
+worker: Dict[str, Any] = dict()
 
 
 def levenshtein(string1: str, string2: str) -> int:
-    fprint("info", f"calculating distance between {string1} -> {string2}")
     n = len(string1)
     m = len(string2)
     d = [[0 for x in range(n + 1)] for y in range(m + 1)]
@@ -43,7 +87,7 @@ def levenshtein(string1: str, string2: str) -> int:
         d[0][j] = j
     for j in range(1, n + 1):
         for i in range(1, m + 1):
-            if string1[j - 1] is string2[i - 1]:
+            if string1[j - 1] == string2[i - 1]:
                 delta = 0
             else:
                 delta = 1
@@ -51,24 +95,388 @@ def levenshtein(string1: str, string2: str) -> int:
     return d[m][n]
 
 
-def cluster_keywords(searches: List[str], damping: float, fpath: Path) -> pd.DataFrame:
-    words: np.ndarray[Any, Any] = np.asarray(searches)
-    if damping < 0.5 or damping > 1.0:
-        fprint("error", "the damping factor should be a number between 0.5 and 1.0")
+def encode_keywords(words: List[str]) -> Tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+    lengths = np.array([len(w) for w in words], dtype=np.int64)
+    width = int(lengths.max()) if len(words) else 0
+    codes = np.full((len(words), width), -1, dtype=np.int32)
+    for i, word in enumerate(words):
+        codes[i, : len(word)] = np.frombuffer(word.encode("utf-32-le"), dtype=np.int32)
+    return codes, lengths
+
+
+def levenshtein_dp(codes: np.ndarray[Any, Any], lengths: np.ndarray[Any, Any], left: np.ndarray[Any, Any], right: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+    # one row of the dynamic programming table per step, for every pair at once (pairs along the last axis)
+    # the insertion dependency within a row is resolved as a running minimum: d[j] = j + min(d[k] - k for k <= j)
+    size = len(left)
+    rows_lengths = lengths[left]
+    cols_lengths = lengths[right]
+    rows = int(rows_lengths.max()) if size else 0
+    cols = int(cols_lengths.max()) if size else 0
+    string1 = np.ascontiguousarray(codes[left, :rows].T)
+    string2 = np.ascontiguousarray(codes[right, :cols].T)
+    steps = np.arange(cols + 1, dtype=np.int32)[:, None]
+    previous = np.repeat(steps, size, axis=1)
+    current = np.empty_like(previous)
+    distances: np.ndarray[Any, Any] = cols_lengths.astype(np.int32)
+    pairs = np.arange(size)
+    for i in range(1, rows + 1):
+        current[0] = i
+        np.add(previous[:-1], string2 != string1[i - 1], out=current[1:])
+        np.minimum(current[1:], previous[1:] + 1, out=current[1:])
+        current -= steps
+        np.minimum.accumulate(current, axis=0, out=current)
+        current += steps
+        done = rows_lengths == i
+        distances[done] = current[cols_lengths[done], pairs[done]]
+        previous, current = current, previous
+    return distances
+
+
+def levenshtein_bitparallel(codes: np.ndarray[Any, Any], lengths: np.ndarray[Any, Any], left: np.ndarray[Any, Any], right: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+    # myers' bit-vector algorithm, the left keyword of every pair must fit in a 64 bit word
+    size = len(left)
+    rows_lengths = lengths[left]
+    cols_lengths = lengths[right]
+    rows = int(rows_lengths.max()) if size else 0
+    cols = int(cols_lengths.max()) if size else 0
+    patterns, owners = np.unique(left, return_inverse=True)
+    pattern_codes = codes[patterns, :rows]
+    alphabet = np.unique(pattern_codes[pattern_codes >= 0])
+    peq = np.zeros((len(patterns), len(alphabet) + 1), dtype=np.uint64)
+    which, position = np.nonzero(pattern_codes >= 0)
+    symbols = np.searchsorted(alphabet, pattern_codes[which, position])
+    np.bitwise_or.at(peq, (which, symbols), np.left_shift(np.uint64(1), position.astype(np.uint64)))
+    text = codes[right, :cols]
+    found = np.minimum(np.searchsorted(alphabet, text), max(len(alphabet) - 1, 0))
+    text = np.ascontiguousarray(np.where(alphabet[found] == text, found, len(alphabet)).T) if len(alphabet) else np.zeros((cols, size), dtype=np.int64)
+    one = np.uint64(1)
+    highbit = np.left_shift(one, np.maximum(rows_lengths - 1, 0).astype(np.uint64))
+    pv = np.full(size, np.iinfo(np.uint64).max, dtype=np.uint64)
+    mv = np.zeros(size, dtype=np.uint64)
+    score = rows_lengths.astype(np.int32)
+    distances: np.ndarray[Any, Any] = rows_lengths.astype(np.int32)
+    for j in range(cols):
+        eq = peq[owners, text[j]]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        score += (ph & highbit) != 0
+        score -= (mh & highbit) != 0
+        ph = (ph << one) | one
+        mh = mh << one
+        pv = mh | ~(xv | ph)
+        mv = ph & xv
+        done = cols_lengths == j + 1
+        distances[done] = score[done]
+    empty = rows_lengths == 0
+    distances[empty] = cols_lengths[empty]
+    return distances
+
+
+def levenshtein_pairs(codes: np.ndarray[Any, Any], lengths: np.ndarray[Any, Any], left: np.ndarray[Any, Any], right: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+    swap = lengths[left] > lengths[right]
+    left, right = np.where(swap, right, left), np.where(swap, left, right)
+    distances = np.empty(len(left), dtype=np.int32)
+    short = lengths[left] <= 64
+    distances[short] = levenshtein_bitparallel(codes, lengths, left[short], right[short])
+    distances[~short] = levenshtein_dp(codes, lengths, left[~short], right[~short])
+    return distances
+
+
+def row_blocks(n: int, chunksize: int) -> Iterator[Tuple[int, int]]:
+    start = 0
+    while start < n - 1:
+        stop = start
+        pairs = 0
+        while stop < n - 1 and pairs < chunksize:
+            pairs += n - stop - 1
+            stop += 1
+        yield start, stop
+        start = stop
+
+
+def block_pairs(n: int, start: int, stop: int) -> Tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+    rows = np.arange(start, stop)
+    left = np.repeat(rows, n - 1 - rows)
+    right = np.concatenate([np.arange(i + 1, n) for i in rows])
+    return left, right
+
+
+def compute_block(words: List[str], engine: str, left: np.ndarray[Any, Any], right: np.ndarray[Any, Any], codes: Any, lengths: Any) -> np.ndarray[Any, Any]:
+    if engine == "python":
+        return np.array([levenshtein(words[i], words[j]) for i, j in zip(left, right)], dtype=np.int64)
+    return levenshtein_pairs(codes, lengths, left, right)
+
+
+def triangle_offset(n: int, row: int) -> int:
+    return row * n - row * (row + 1) // 2
+
+
+def distance_dtype(words: List[str]) -> Any:
+    longest = max([len(w) for w in words], default=0)
+    if longest <= np.iinfo(np.uint8).max:
+        return np.uint8
+    if longest <= np.iinfo(np.uint16).max:
+        return np.uint16
+    return np.uint32
+
+
+def start_worker(words: List[str], engine: str, fpath: Optional[Path], dtype: Any) -> None:
+    size = len(words) * (len(words) - 1) // 2
+    codes, lengths = encode_keywords(words) if engine == "numpy" else (None, None)
+    distances = np.memmap(fpath, dtype=dtype, mode="r+", shape=(size,)) if fpath else np.zeros(size, dtype=dtype)
+    worker.update({"words": words, "engine": engine, "codes": codes, "lengths": lengths, "distances": distances})
+
+
+def fill_block(start: int, stop: int) -> int:
+    words = worker["words"]
+    n = len(words)
+    left, right = block_pairs(n, start, stop)
+    distances = compute_block(words, worker["engine"], left, right, worker["codes"], worker["lengths"])
+    worker["distances"][triangle_offset(n, start) : triangle_offset(n, stop)] = distances
+    return len(left)
+
+
+def condensed_distances(words: List[str], engine: str, jobs: int, fpath: Optional[Path], chunksize: int = CHUNKSIZE) -> np.ndarray[Any, Any]:
+    # upper triangle of the distance matrix in row order, pass a file path to keep it in a memory-mapped file
+    if engine not in ENGINES:
+        fprint("error", f"unsupported engine, try any of {', '.join(ENGINES)}")
         sys.exit()
-    fprint("info", f"computing levenshtein similarity for {len(words)} keywords")
-    distance_matrix = -1 * np.array([[levenshtein(w1, w2) for w1 in words] for w2 in words])
-    affprop = AffinityPropagation(affinity="precomputed", damping=damping, max_iter=1000)
-    affprop.fit(distance_matrix)
+    if jobs < 1:
+        fprint("error", "the number of jobs should be at least 1")
+        sys.exit()
+    n = len(words)
+    total = n * (n - 1) // 2
+    dtype = distance_dtype(words)
+    blocks = list(row_blocks(n, chunksize))
+    computed = 0
+    if fpath and total:
+        np.memmap(fpath, dtype=dtype, mode="w+", shape=(total,)).flush()
+    else:
+        fpath = None
+    if jobs == 1 or len(blocks) < 2 or not fpath:
+        start_worker(words, engine, fpath, dtype)
+        for start, stop in blocks:
+            computed += fill_block(start, stop)
+            fprint("info", f"computed {computed}/{total} keyword distances ({stop}/{n} rows)")
+        distances: np.ndarray[Any, Any] = worker.pop("distances")
+        worker.clear()
+        return distances
+    with ProcessPoolExecutor(max_workers=jobs, initializer=start_worker, initargs=(words, engine, fpath, dtype)) as executor:
+        futures = [executor.submit(fill_block, start, stop) for start, stop in blocks]
+        for f in as_completed(futures):
+            computed += f.result()
+            fprint("info", f"computed {computed}/{total} keyword distances ({len(futures)} blocks on {jobs} processes)")
+    return np.memmap(fpath, dtype=dtype, mode="r", shape=(total,))
+
+
+def median_similarity(distances: np.ndarray[Any, Any], n: int) -> float:
+    # median of the full similarity matrix (diagonal included), as affinity propagation computes its default preference
+    counts = np.zeros(1, dtype=np.int64)
+    for start in range(0, len(distances), MEDIAN_CHUNKSIZE):
+        chunk = np.bincount(distances[start : start + MEDIAN_CHUNKSIZE])
+        counts = np.pad(counts, (0, max(len(chunk) - len(counts), 0)))
+        counts[: len(chunk)] += 2 * chunk
+    counts[0] += n
+    cumulative = np.cumsum(counts)
+    total = n * n
+    lower = np.searchsorted(cumulative, (total - 1) // 2, side="right")
+    upper = np.searchsorted(cumulative, total // 2, side="right")
+    return -(lower + upper) / 2
+
+
+def similarity_matrix(distances: np.ndarray[Any, Any], n: int) -> np.ndarray[Any, Any]:
+    similarity = np.zeros((n, n), dtype=np.float64)
+    for i in range(n - 1):
+        row = distances[triangle_offset(n, i) : triangle_offset(n, i + 1)]
+        similarity[i, i + 1 :] = row
+        similarity[i + 1 :, i] = row
+    return np.negative(similarity, out=similarity)
+
+
+def minhash_signatures(words: List[str], permutations: int) -> np.ndarray[Any, Any]:
+    shingles = list()
+    for word in words:
+        padded = f" {word} "
+        grams = {padded[i : i + NGRAM] for i in range(len(padded) - NGRAM + 1)} or {padded}
+        shingles.append([zlib.crc32(g.encode("utf-8")) for g in grams])
+    counts = np.array([len(i) for i in shingles])
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    hashes = np.fromiter(itertools.chain.from_iterable(shingles), dtype=np.uint64, count=int(counts.sum()))
+    generator = np.random.default_rng(0)
+    multipliers = generator.integers(1, 2**63, size=permutations, dtype=np.uint64) | np.uint64(1)
+    increments = generator.integers(0, 2**63, size=permutations, dtype=np.uint64)
+    signatures = np.empty((len(words), permutations), dtype=np.uint64)
+    for p in range(permutations):
+        permuted = (hashes * multipliers[p] + increments[p]) >> np.uint64(32)
+        signatures[:, p] = np.minimum.reduceat(permuted, offsets)
+    return signatures
+
+
+def candidate_pairs(words: List[str]) -> Tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+    # keywords landing in the same bucket for any band are candidates, large buckets only pair close neighbours
+    n = len(words)
+    signatures = minhash_signatures(words, BANDS * BAND_ROWS)
+    ranks = np.argsort(np.argsort(np.asarray(words, dtype=object)))
+    mixers = np.random.default_rng(1).integers(1, 2**63, size=BAND_ROWS, dtype=np.uint64) | np.uint64(1)
+    candidates = list()
+    for band in range(BANDS):
+        keys = (signatures[:, band * BAND_ROWS : (band + 1) * BAND_ROWS] * mixers).sum(axis=1, dtype=np.uint64)
+        order = np.lexsort((ranks, keys))
+        keys = keys[order]
+        for k in range(1, min(BUCKET_WINDOW, n - 1) + 1):
+            same = keys[:-k] == keys[k:]
+            left, right = order[:-k][same], order[k:][same]
+            candidates.append(np.minimum(left, right) * n + np.maximum(left, right))
+    pairs = np.unique(np.concatenate(candidates)) if candidates else np.empty(0, dtype=np.int64)
+    return pairs // n, pairs % n
+
+
+def graph_clusters(searches: List[str], engine: str, threshold: float, chunksize: int = CHUNKSIZE) -> Tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+    n = len(searches)
+    fprint("info", f"finding candidate pairs for {n} keywords")
+    left, right = candidate_pairs(searches)
+    codes, lengths = encode_keywords(searches)
+    longest = np.maximum(np.maximum(lengths[left], lengths[right]), 1)
+    close = np.abs(lengths[left] - lengths[right]) <= threshold * longest
+    left, right, longest = left[close], right[close], longest[close]
+    total = len(left)
+    fprint("info", f"computing levenshtein similarity for {total} candidate pairs")
+    edges = list()
+    for start in range(0, total, chunksize):
+        stop = min(start + chunksize, total)
+        distances = compute_block(searches, engine, left[start:stop], right[start:stop], codes, lengths)
+        similar = distances <= threshold * longest[start:stop]
+        weights = 1.0 - distances[similar] / longest[start:stop][similar]
+        edges.append((left[start:stop][similar], right[start:stop][similar], weights))
+        fprint("info", f"computed {stop}/{total} keyword distances")
+    rows = np.concatenate([i[0] for i in edges] + [np.empty(0, dtype=np.int64)])
+    cols = np.concatenate([i[1] for i in edges] + [np.empty(0, dtype=np.int64)])
+    weights = np.concatenate([i[2] for i in edges] + [np.empty(0)])
+    graph = coo_matrix((np.concatenate([weights, weights]), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))), shape=(n, n)).tocsr()
+    fprint("info", f"linking {n} keywords through {len(weights)} similar pairs")
+    return star_clusters(graph)
+
+
+def star_clusters(graph: csr_matrix) -> Tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+    # keywords are never chained through their neighbours, every keyword is within the threshold of its own exemplar
+    n = graph.shape[0]
+    strength = np.asarray(graph.sum(axis=1)).ravel()
+    exemplars = np.zeros(n, dtype=bool)
+    covered = np.zeros(n, dtype=bool)
+    for node in np.lexsort((np.arange(n), -strength)):
+        if covered[node]:
+            continue
+        exemplars[node] = True
+        covered[node] = True
+        covered[graph.indices[graph.indptr[node] : graph.indptr[node + 1]]] = True
+    centers = np.flatnonzero(exemplars)
+    labels = np.cumsum(exemplars) - 1
+    edges = graph.tocoo()
+    joins = exemplars[edges.col] & ~exemplars[edges.row]
+    members, targets, weights = edges.row[joins], edges.col[joins], edges.data[joins]
+    order = np.lexsort((targets, -weights, members))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = members[order][1:] != members[order][:-1]
+    labels[members[order][first]] = labels[targets[order][first]]
+    return labels, centers
+
+
+def label_clusters(searches: List[str], labels: np.ndarray[Any, Any], centers: np.ndarray[Any, Any]) -> pd.DataFrame:
+    words: np.ndarray[Any, Any] = np.asarray(searches)
     datasets = list()
     fprint("info", "applying labels to clusters")
-    for label in np.unique(affprop.labels_):
-        exemplar = searches[affprop.cluster_centers_indices_[label]]
-        cluster: np.ndarray[Any, Any] = np.unique(words[np.nonzero(affprop.labels_ == label)])
+    for label in np.unique(labels):
+        exemplar = searches[centers[label]]
+        cluster: np.ndarray[Any, Any] = np.unique(words[np.nonzero(labels == label)])
         zipped = list(zip(cluster, itertools.cycle([exemplar])))
         data = pd.DataFrame(zipped, columns=["keywords", "cluster"])
         datasets.append(data)
+    return pd.concat(datasets, ignore_index=True)
+
+
+def nearest_exemplars(searches: List[str], exemplars: List[str], engine: str, threshold: float, chunksize: int = CHUNKSIZE) -> np.ndarray[Any, Any]:
+    # index of the closest exemplar for every keyword, -1 when none is within the threshold
+    words = searches + exemplars
+    n = len(searches)
+    codes, lengths = encode_keywords(words)
+    left = np.repeat(np.arange(n), len(exemplars))
+    right = np.tile(np.arange(n, len(words)), n)
+    longest = np.maximum(np.maximum(lengths[left], lengths[right]), 1)
+    close = np.abs(lengths[left] - lengths[right]) <= threshold * longest
+    left, right, longest = left[close], right[close], longest[close]
+    best = np.full(n, np.inf)
+    nearest = np.full(n, -1, dtype=np.int64)
+    total = len(left)
+    fprint("info", f"computing levenshtein similarity for {total} keyword and exemplar pairs")
+    for start in range(0, total, chunksize):
+        stop = min(start + chunksize, total)
+        relative = compute_block(words, engine, left[start:stop], right[start:stop], codes, lengths) / longest[start:stop]
+        order = np.lexsort((relative, left[start:stop]))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = left[start:stop][order][1:] != left[start:stop][order][:-1]
+        owners, scores, targets = left[start:stop][order][first], relative[order][first], right[start:stop][order][first]
+        better = (scores <= threshold) & (scores < best[owners])
+        best[owners[better]] = scores[better]
+        nearest[owners[better]] = targets[better] - n
+    return nearest
+
+
+def fit_clusters(searches: List[str], damping: float, engine: str, jobs: int, method: str, threshold: float, memmap: bool) -> Tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+    n = len(searches)
+    if n < 2:
+        return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    if method == "graph":
+        with span("graph clustering", "cluster", keywords=n):
+            return graph_clusters(searches, engine, threshold)
+    fprint("info", f"computing levenshtein similarity for {n} keywords")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        storage = Path(tmpdir) / "distances.dat" if memmap or jobs > 1 else None
+        with span("levenshtein distances", "cluster", keywords=n, engine=engine, jobs=jobs):
+            distances = condensed_distances(searches, engine, jobs, storage)
+        with span("similarity matrix", "cluster", keywords=n):
+            preference = median_similarity(distances, n)
+            similarity = similarity_matrix(distances, n)
+        del distances
+    affprop = AffinityPropagation(affinity="precomputed", damping=damping, max_iter=1000, preference=preference, copy=False)
+    with span("affinity propagation", "cluster", keywords=n):
+        affprop.fit(similarity)
+    return affprop.labels_, affprop.cluster_centers_indices_
+
+
+def update_clusters(searches: List[str], previous: TextIO, damping: float, engine: str, jobs: int, method: str, threshold: float, memmap: bool) -> pd.DataFrame:
+    clustered = pd.read_csv(previous, index_col=0, dtype=str, keep_default_na=False)
+    exemplars = list(clustered["cluster"].unique())
+    known = set(clustered["keywords"])
+    additions = list(dict.fromkeys([i for i in searches if i not in known]))
+    fprint("info", f"assigning {len(additions)} new keywords to {len(exemplars)} existing clusters")
+    nearest = nearest_exemplars(additions, exemplars, engine, threshold) if additions and exemplars else np.full(len(additions), -1)
+    assigned = pd.DataFrame({"keywords": additions, "cluster": [exemplars[i] if i >= 0 else "" for i in nearest]})
+    assigned = assigned.loc[nearest >= 0]
+    remaining = [w for w, i in zip(additions, nearest) if i < 0]
+    fprint("info", f"{len(assigned)} keywords joined existing clusters, clustering the remaining {len(remaining)}")
+    datasets = [clustered, assigned]
+    if remaining:
+        labels, centers = fit_clusters(remaining, damping, engine, jobs, method, threshold, memmap)
+        datasets.append(label_clusters(remaining, labels, centers))
     dataframe = pd.concat(datasets, ignore_index=True)
-    dataframe.to_csv(fpath)
+    return dataframe.sort_values(["cluster", "keywords"], kind="stable").reset_index(drop=True)
+
+
+def cluster_keywords(searches: List[str], damping: float, fpath: Path, engine: str, jobs: int, method: str, threshold: float, memmap: bool, previous: Optional[TextIO]) -> pd.DataFrame:
+    if damping < 0.5 or damping > 1.0:
+        fprint("error", "the damping factor should be a number between 0.5 and 1.0")
+        sys.exit()
+    if threshold < 0.0 or threshold > 1.0:
+        fprint("error", "the threshold should be a number between 0.0 and 1.0")
+        sys.exit()
+    if previous:
+        dataframe = update_clusters(searches, previous, damping, engine, jobs, method, threshold, memmap)
+    else:
+        labels, centers = fit_clusters(searches, damping, engine, jobs, method, threshold, memmap)
+        dataframe = label_clusters(searches, labels, centers)
+    with span("write csv", "output", rows=len(dataframe)):
+        dataframe.to_csv(fpath)
     fprint("info", f"clustering completed ~ find your output @ {fpath}")
     return dataframe
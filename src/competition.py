@@ -2,40 +2,135 @@
 Find the most prominent competitors for a keyword set.
 
 Given a list of keywords, this algorithm creates a sorted list of Google Search domains ordered by frequency of appearance.
+
+Searches are tallied as they come in and checkpointed to disk (~/.cache/serene/competition).
+When a run is interrupted, or some searches fail, running the same file and location again resumes where it stopped.
+
+The --visibility option adds a visibility score and sorts the domains by it.
+Each appearance is weighted by the expected CTR of its position and the keyword search volume.
+
+> visibility = sum(ctr(position) * search volume)
+
+With --visibility, the keyword file can hold the search volume in a second column e.g., 'keyword,1200'.
+Keywords without a search volume count as a volume of one.
 """
 
 import csv
+import hashlib
+import json
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List, Tuple
 
-import requests
+import numpy as np
+import pandas as pd
 
-from src.apicalls import query_valueserp
+from src.apicalls import fetch_valueserp
+from src.authentication import reserve_api_credit
+from src.concurrency import concurrency_level, run_concurrently
+from src.concurrency import settings as concurrency_settings
 from src.formatting import fprint
+from src.profiling import span
+from src.urlmap import expected_ctr
+
+CHECKPOINT_PATH = Path("~/.cache/serene/competition").expanduser()
+
+
+def read_keywords(lines: List[str], visibility: bool) -> Tuple[List[str], List[float]]:
+    if not visibility:
+        return lines, [1.0] * len(lines)
+    keywords, volumes = list(), list()
+    for row in csv.reader(lines):
+        keyword = row[0] if row else ""
+        keywords.append(keyword)
+        try:
+            volumes.append(float(row[1]))
+        except (IndexError, ValueError):
+            volumes.append(1.0)
+    return keywords, volumes
+
 
-session = requests.Session()
+def checkpoint_file(keywords: List[str], location: str) -> Path:
+    serialized = json.dumps([location, keywords], ensure_ascii=False)
+    return CHECKPOINT_PATH / f"{hashlib.sha256(serialized.encode('utf-8')).hexdigest()[:16]}.jsonl"
 
 
-def enumerate_competition(keywords: List[str], location: str, fpath: Path) -> Dict[str, int]:
+def read_checkpoint(fpath: Path) -> Dict[int, List[Tuple[str, int]]]:
+    # a run killed mid write leaves a partial last line, it is skipped and searched again
+    results: Dict[int, List[Tuple[str, int]]] = dict()
+    if not fpath.exists():
+        return results
+    with open(fpath) as file_object:
+        for line in file_object:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[entry["index"]] = [(domain, position) for domain, position in entry["results"]]
+    return results
+
+
+def collect_results(response: Dict[str, Any]) -> List[Tuple[str, int]]:
+    results = list()
+    # a successful search without organic results has no competitors, it is kept as an empty result
+    for rank, result in enumerate(response.get("organic_results", []), start=1):
+        if "domain" in result:
+            results.append((result["domain"].replace("www.", ""), int(result.get("position", rank))))
+    return results
+
+
+def score_visibility(results: Dict[int, List[Tuple[str, int]]], volumes: List[float]) -> Dict[str, float]:
+    rows = [(domain, position, volumes[index]) for index, serps in results.items() for domain, position in serps]
+    if not rows:
+        return dict()
+    domains, positions, weights = zip(*rows)
+    codes, uniques = pd.factorize(pd.Series(domains))
+    scores = np.bincount(codes, weights=expected_ctr(np.array(positions, dtype=float)) * np.array(weights), minlength=len(uniques))
+    return dict(zip(uniques, np.round(scores, 2)))
+
+
+def enumerate_competition(lines: List[str], location: str, fpath: Path, visibility: bool) -> Dict[str, int]:
+    keywords, volumes = read_keywords(lines, visibility)
     total = len(keywords)
     location = location.title()
     fprint("info", f"collecting competitors for {total} keywords - location: {location.title()}")
-    domains: List[List[str]] = list()
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = executor.map(lambda i: query_valueserp(i, location), keywords)
-        for f in futures:
-            response = f.json()
-            serps = [i["domain"] for i in response["organic_results"] if "domain" in i]
-            domains.append(serps)
-    flat_domain_list = [i.replace("www.", "") for sublist in domains for i in sublist]
-    tally = dict(Counter(flat_domain_list))
-    sorted_tally = dict(sorted(tally.items(), key=lambda x: x[1], reverse=True))
-    file_object = open(fpath, "w")
-    writer = csv.writer(file_object)
-    for k, v in sorted_tally.items():
-        writer.writerow([k, v])
-    file_object.close()
+    checkpoint = checkpoint_file(keywords, location)
+    results = read_checkpoint(checkpoint)
+    tally: Counter[str] = Counter(domain for serps in results.values() for domain, _ in serps)
+    pending = [i for i in range(total) if i not in results]
+    if results:
+        fprint("info", f"resuming from checkpoint, {len(results)} of {total} keywords already collected")
+    reserve_api_credit("valueserp", len(pending))
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    with open(checkpoint, "a") as file_object:
+
+        async def collect_keyword(index: int) -> bool:
+            # every search is tallied and checkpointed as soon as it completes, a slow search does not hold back the others
+            response = await fetch_valueserp(keywords[index], location)
+            if not response:
+                return False
+            results[index] = collect_results(response)
+            tally.update(domain for domain, _ in results[index])
+            file_object.write(json.dumps({"index": index, "results": results[index]}, ensure_ascii=False) + "\n")
+            file_object.flush()
+            if len(results) % concurrency_settings["ceiling"] == 0 or len(results) == total:
+                fprint("info", f"collected {len(results)} of {total} keywords (concurrency {concurrency_level('valueserp')})")
+            return True
+
+        failed = run_concurrently([partial(collect_keyword, i) for i in pending]).count(False)
+    if failed:
+        fprint("warning", f"{failed} keywords failed, run the same file again to retry them")
+    else:
+        checkpoint.unlink()
+    scores = score_visibility(results, volumes) if visibility else dict()
+    order = scores if visibility else tally
+    sorted_tally = dict(sorted(tally.items(), key=lambda x: order[x[0]], reverse=True))
+    with span("write csv", "output", rows=len(sorted_tally)):
+        file_object = open(fpath, "w")
+        writer = csv.writer(file_object)
+        for k, v in sorted_tally.items():
+            writer.writerow([k, v, scores[k]] if visibility else [k, v])
+        file_object.close()
     fprint("info", f"competitors collected ~ find your output @ {fpath}")
     return sorted_tally
@@ -0,0 +1,228 @@
+"""
+Run API calls concurrently.
+
+Calls are scheduled on an asyncio event loop with a global limit (the ceiling, see --max-concurrency) on the number of calls in flight.
+Each API has a token bucket rate limiter, and failed requests (connection errors, 429 and 5xx responses) are retried with exponential backoff and full jitter.
+The HTTP requests themselves are blocking, they run on a thread pool sized to the ceiling while the event loop does the scheduling.
+
+The number of requests in flight per API adapts to how the API responds (additive increase, multiplicative decrease).
+It starts low and doubles per round trip until the first sign of congestion, then grows by one request per round trip.
+A failed request halves it (once per round trip), and it stops growing while responses are much slower than the fastest seen so far.
+
+Identical calls in flight at the same time (same search, same page) share a single request and its result.
+
+References:
+
+> https://docs.python.org/3/library/asyncio-task.html
+> https://en.wikipedia.org/wiki/Token_bucket
+> https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+> https://en.wikipedia.org/wiki/Additive_increase/multiplicative_decrease
+"""
+
+import asyncio
+import math
+import random
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+import requests
+
+from src.constants import MAX_CONCURRENCY
+from src.formatting import fprint
+from src.profiling import count
+
+INITIAL_CONCURRENCY = 4
+
+MIN_CONCURRENCY = 1
+
+# a response this many times slower than the fastest one stops the concurrency from growing
+LATENCY_TOLERANCE = 3.0
+
+MAX_RETRIES = 5
+
+BACKOFF_BASE = 0.5
+
+BACKOFF_CAP = 30.0
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# requests per second and burst size
+RATE_LIMITS = {"valueserp": (10.0, 20), "semrush": (10.0, 10)}
+
+T = TypeVar("T")
+
+settings: Dict[str, int] = {"ceiling": MAX_CONCURRENCY}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ConcurrencyLimit:
+    def __init__(self, initial: int) -> None:
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.waiters: Deque["asyncio.Future[None]"] = deque()
+        self.fastest = math.inf
+        self.decreased = 0.0
+        self.slow_start = True
+
+    @property
+    def level(self) -> int:
+        return max(MIN_CONCURRENCY, min(settings["ceiling"], int(self.limit)))
+
+    async def acquire(self) -> None:
+        while self.in_flight >= self.level:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # a wake up that arrived just before the cancellation is handed on to the next waiter
+                if waiter.done() and not waiter.cancelled():
+                    self.wake()
+                raise
+        self.in_flight += 1
+
+    def wake(self) -> None:
+        # waiters whose task was cancelled are dropped without using up a free slot
+        available = self.level - self.in_flight
+        while available > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                available -= 1
+
+    def release(self, latency: float, failed: Optional[bool]) -> None:
+        # failed is None for a cancelled request, it frees its slot but says nothing about congestion
+        self.in_flight -= 1
+        if failed is not None:
+            self.adjust(latency, failed)
+        self.wake()
+
+    def adjust(self, latency: float, failed: bool) -> None:
+        now = time.monotonic()
+        self.fastest = min(self.fastest, latency)
+        if failed:
+            # requests that were already in flight fail together, they count as a single congestion signal
+            if now - self.decreased > latency:
+                self.limit = max(MIN_CONCURRENCY, self.limit / 2)
+                self.decreased = now
+                self.slow_start = False
+        elif latency <= LATENCY_TOLERANCE * self.fastest:
+            self.limit = min(settings["ceiling"], self.limit + (1 if self.slow_start else 1 / self.limit))
+        else:
+            self.slow_start = False
+
+
+buckets = {api: TokenBucket(rate, capacity) for api, (rate, capacity) in RATE_LIMITS.items()}
+
+limits = {api: ConcurrencyLimit(INITIAL_CONCURRENCY) for api in RATE_LIMITS}
+
+executors: Dict[str, ThreadPoolExecutor] = dict()
+
+flights: Dict[Tuple[str, Hashable], "asyncio.Future[Any]"] = dict()
+
+coalesced: Dict[str, int] = Counter()
+
+
+def configure_concurrency(ceiling: int) -> None:
+    settings.update({"ceiling": max(MIN_CONCURRENCY, ceiling)})
+
+
+def concurrency_level(api_name: str) -> int:
+    return limits[api_name].level
+
+
+def get_executor() -> ThreadPoolExecutor:
+    if "executor" not in executors:
+        executors["executor"] = ThreadPoolExecutor(max_workers=settings["ceiling"])
+    return executors["executor"]
+
+
+def backoff_delay(attempt: int, response: Optional[requests.Response]) -> float:
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_CAP)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+
+async def run_blocking(function: Callable[..., T], *args: Any) -> T:
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), function, *args)
+
+
+async def request_with_retries(api_name: str, send: Callable[[], requests.Response]) -> Optional[requests.Response]:
+    # returns the last response (possibly an error response) or None when every attempt failed to connect
+    response = None
+    for attempt in range(MAX_RETRIES + 1):
+        await buckets[api_name].acquire()
+        await limits[api_name].acquire()
+        start = time.monotonic()
+        failed = None
+        try:
+            response = await run_blocking(send)
+            failed = response.status_code in RETRY_STATUS_CODES
+            reason = f"status {response.status_code}"
+        except requests.RequestException as error:
+            failed = True
+            response = None
+            reason = type(error).__name__
+        finally:
+            limits[api_name].release(time.monotonic() - start, failed)
+        if not failed:
+            return response
+        if attempt < MAX_RETRIES:
+            delay = backoff_delay(attempt, response)
+            count(f"{api_name}.retries")
+            fprint("warning", f"{api_name} request failed ({reason}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    fprint("error", f"{api_name} request failed after {MAX_RETRIES + 1} attempts")
+    return response
+
+
+async def single_flight(name: str, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+    # the first caller starts the call, callers with the same key arriving before it finishes wait for the same result (or exception)
+    flight = (name, key)
+    if flight in flights:
+        coalesced[name] += 1
+        count(f"{name}.coalesced")
+    else:
+        flights[flight] = asyncio.ensure_future(call())
+        flights[flight].add_done_callback(lambda _: flights.pop(flight, None))
+    result: T = await asyncio.shield(flights[flight])
+    return result
+
+
+def report_coalesced() -> None:
+    for name, saved in coalesced.items():
+        fprint("info", f"{saved} duplicate {name} calls shared a request already in flight")
+
+
+def run_concurrently(calls: Sequence[Callable[[], Awaitable[T]]]) -> List[T]:
+    # results come back in the order of the calls
+    async def gather() -> List[T]:
+        semaphore = asyncio.Semaphore(settings["ceiling"])
+
+        async def limited(call: Callable[[], Awaitable[T]]) -> T:
+            async with semaphore:
+                return await call()
+
+        return await asyncio.gather(*[limited(c) for c in calls])
+
+    return asyncio.run(gather())
@@ -2,6 +2,22 @@
 Constant values for reuse across the codebase.
 """
 
+ENGINES = ["numpy", "python"]
+
+METHODS = ["affinity", "graph"]
+
+PAGE_MAX_BYTES = 2 * 1024 * 1024
+
+MAX_CONCURRENCY = 20
+
+# api base urls, looked up on every call so they can be pointed elsewhere e.g., at the local server of the benchmarks
+ENDPOINTS = {
+    "valueserp": "https://api.valueserp.com",
+    "semrush": "https://api.semrush.com",
+    "semrush_units": "http://www.semrush.com",
+    "pagespeed": "https://www.googleapis.com",
+    "searchconsole": "https://searchconsole.googleapis.com",
+}
 
 VALUESERP_LOCATIONS = {
     "Norway": ["google.no", "no", "no"],
@@ -0,0 +1,75 @@
+"""
+Exclude rows matching a list of terms.
+
+The terms are matched literally (regex characters in a term have no special meaning) and compiled once into a single trie shaped pattern.
+Shared prefixes are merged, so each position of a value is checked against all the terms in one pass, like an Aho-Corasick automaton.
+Terms with slashes e.g., '/path' or '/path/' are matched against the page (url) column, terms without slashes against the keyword column.
+
+Columns are filtered in bulk, each distinct value is matched once and the result is broadcast back to the rows.
+
+References:
+
+> https://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_algorithm
+> https://en.wikipedia.org/wiki/Trie
+"""
+
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Pattern
+
+import numpy as np
+import pandas as pd
+
+
+class Exclusions(NamedTuple):
+    paths: Optional[Pattern[str]]
+    keywords: Optional[Pattern[str]]
+
+
+def trie_pattern(node: Dict[str, Any]) -> str:
+    # a term ending here already matches, so longer terms sharing the prefix can be dropped
+    if "" in node:
+        return ""
+    branches = [re.escape(char) + trie_pattern(child) for char, child in sorted(node.items())]
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+
+def compile_terms(terms: List[str]) -> Optional[Pattern[str]]:
+    trie: Dict[str, Any] = dict()
+    for term in terms:
+        if not term:
+            continue
+        node = trie
+        for char in term:
+            node = node.setdefault(char, dict())
+        node[""] = dict()
+    if not trie:
+        return None
+    return re.compile(trie_pattern(trie))
+
+
+def compile_exclusions(terms: Optional[List[str]], paths: bool = True) -> Exclusions:
+    # without a page column every term is matched against the keywords, slashes included
+    terms = terms or list()
+    if not paths:
+        return Exclusions(None, compile_terms(terms))
+    path_terms = [i.replace("/", "") for i in terms if "/" in i]
+    keyword_terms = [i for i in terms if "/" not in i]
+    return Exclusions(compile_terms(path_terms), compile_terms(keyword_terms))
+
+
+def match_values(values: pd.Series, pattern: Pattern[str]) -> np.ndarray[Any, Any]:
+    codes, uniques = pd.factorize(values)
+    hits = np.fromiter((pattern.search(str(i)) is not None for i in uniques), dtype=bool, count=len(uniques))
+    matches = np.zeros(len(values), dtype=bool)
+    known = codes >= 0
+    matches[known] = hits[codes[known]]
+    return matches
+
+
+def exclude_rows(data: pd.DataFrame, exclusions: Exclusions, keyword_column: str = "keyword", path_column: str = "url") -> pd.DataFrame:
+    matches = np.zeros(len(data), dtype=bool)
+    if exclusions.paths is not None:
+        matches |= match_values(data[path_column], exclusions.paths)
+    if exclusions.keywords is not None:
+        matches |= match_values(data[keyword_column], exclusions.keywords)
+    return data.loc[~matches]
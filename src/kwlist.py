@@ -2,59 +2,70 @@
 Construct a keyword set based on Google SERPs suggestions.
 
 Given a list of keywords, this algorithm recursively fetches related questions and searches until a cutoff point is met.
+Keywords are expanded breadth first, in concurrent batches: first the seed keywords, then their suggestions, then the suggestions of those, and so on.
+Each keyword (lowercased, extra whitespace removed) is queried at most once, the depth column tells how many steps away from a seed it was found.
 
-The cutoff point represents the minimum number of rows to export.
+The cutoff point represents the minimum number of unique keywords to export.
 The output might contain more keywords than the cutoff point. That's because the algorithm collects all keywords on file.
+
+The --max-depth option limits how far from the seed keywords the expansion goes.
+The --max-requests option limits the number of searches (and credits) a run can use, the run stops early when it is reached.
+
+The --remove option discards keywords containing any of the terms, terms are matched literally.
 """
 
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Deque, Dict, List
 
 import pandas as pd
-import requests
 
-from src.apicalls import query_valueserp
+from src.apicalls import collect_related, query_valueserp_batch
+from src.authentication import reserve_api_credit
+from src.concurrency import concurrency_level
+from src.concurrency import settings as concurrency_settings
+from src.filtering import compile_exclusions, exclude_rows
 from src.formatting import fprint
-
-session = requests.Session()
+from src.profiling import span
 
 
-def collect_related(response: Dict[str, Any]) -> List[str]:
-    related = list()
-    if "related_searches" in response:
-        related.append([i["query"] for i in response["related_searches"]])
-    if "related_questions" in response:
-        related.append([i["question"] for i in response["related_questions"]])
-    return [i for sublist in related for i in sublist]
+def normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
 
 
-def get_kwlist(keywords: List[str], location: str, cutoff: int, fpath: Path, cut: List[str]) -> pd.DataFrame:
+def get_kwlist(keywords: List[str], location: str, cutoff: int, fpath: Path, cut: List[str], max_depth: int, max_requests: int) -> pd.DataFrame:
     total = len(keywords)
     location = location.title()
     fprint("info", f"collecting keyword list from {total} keywords - location: {location.title()}")
-    kw_stack: List[str] = list()
-    kw_stack_length = len(kw_stack)
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = executor.map(lambda i: query_valueserp(i, location), keywords)
-        for f in futures:
-            response = f.json()
-            related = collect_related(response)
-            kw_stack.extend(related)
-            kw_stack_length += len(related)
-    while kw_stack_length < cutoff:
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = executor.map(lambda i: query_valueserp(i, location), kw_stack)
-            for f in futures:
-                stack_response = f.json()
-                stack_related = collect_related(stack_response)
-                kw_stack.extend(stack_related)
-                kw_stack_length += len(stack_related)
-    collection = list(map(str.lower, kw_stack))
-    dataset = pd.DataFrame(collection, columns=["kwset"])
-    if cut:
-        patterns = "|".join([i for i in cut])
-        dataset = dataset.loc[~dataset["kwset"].str.contains(patterns)]
-    dataset.to_csv(fpath)
+    reserve_api_credit("valueserp", max_requests)
+    depths: Dict[str, int] = dict()
+    frontier: Deque[str] = deque()
+    for keyword in map(normalize_keyword, keywords):
+        if keyword and keyword not in depths:
+            depths[keyword] = 0
+            frontier.append(keyword)
+    seeds = len(depths)
+    requests_made = 0
+    while frontier and len(depths) - seeds < cutoff and requests_made < max_requests:
+        batch = [frontier.popleft() for _ in range(min(len(frontier), concurrency_settings["ceiling"], max_requests - requests_made))]
+        requests_made += len(batch)
+        responses = query_valueserp_batch(batch, location)
+        for keyword, response in zip(batch, responses):
+            depth = depths[keyword] + 1
+            for related in map(normalize_keyword, collect_related(response)):
+                if related and related not in depths:
+                    depths[related] = depth
+                    if depth < max_depth:
+                        frontier.append(related)
+        fprint("info", f"collected {len(depths) - seeds} keywords with {requests_made} requests (depth {depth}, concurrency {concurrency_level('valueserp')})")
+    if frontier and requests_made >= max_requests:
+        fprint("warning", f"stopped at the limit of {max_requests} requests")
+    if not frontier and len(depths) - seeds < cutoff:
+        fprint("warning", f"no more suggestions to expand within a depth of {max_depth}")
+    collection = [(k, v) for k, v in depths.items() if v > 0]
+    dataset = pd.DataFrame(collection, columns=["kwset", "depth"])
+    dataset = exclude_rows(dataset, compile_exclusions(cut, paths=False), keyword_column="kwset")
+    with span("write csv", "output", rows=len(dataset)):
+        dataset.to_csv(fpath)
     fprint("info", f"keyword list completed ~ find your output @ {fpath}")
     return dataset
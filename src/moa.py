@@ -1,9 +1,162 @@
-# do nothing script for the moa
-# allow intermediate steps storing
-# store outputs in a desktop with unique id
-# prompt user for responses
-# allow resuming or starting anew
-# allow canceling
-
-# https://blog.danslimmon.com/2019/07/15/do-nothing-scripting-the-key-to-gradual-automation/
-# https://news.ycombinator.com/item?id=29083367
+"""
+Run the keyword research to brief workflow as one resumable job.
+
+The steps run in order, each one feeding the next:
+
+1. kwlist: expand the seed keywords into a keyword list
+2. cluster: cluster the seed keywords together with the keyword list
+3. urlmap: map each cluster (its exemplar keyword) to the page of the domain with the best score
+4. onpage: write a brief for each mapped page, the other keywords of its cluster are the secondary terms
+
+Every step writes its output to the job directory (~/Desktop/moa_<uid> by default).
+The hashes of each step's inputs and output are kept in the job.json file of the directory, and so is the list of briefs already written.
+
+Running the job again with --job DIRECTORY resumes it.
+Steps whose inputs did not change are skipped, and the onpage step continues after the last brief written.
+A step runs again when its inputs change e.g., a different seed file, other options, or a step before it produced a different output.
+Ctrl-C stops the job, the completed steps and briefs are kept.
+
+The --max-briefs option limits the number of briefs (and searches), the clusters with the most keywords come first.
+
+References:
+
+> https://blog.danslimmon.com/2019/07/15/do-nothing-scripting-the-key-to-gradual-automation/
+> https://news.ycombinator.com/item?id=29083367
+"""
+
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import pandas as pd
+
+from src.cluster import cluster_keywords
+from src.formatting import fprint
+from src.kwlist import get_kwlist, normalize_keyword
+from src.onpage import compile_onpage_batch, strip_domain
+from src.urlmap import UNMAPPED, map_domain
+
+JOB_FILE = "job.json"
+
+# briefs written between two progress checkpoints
+BRIEF_CHUNK = 5
+
+# secondary terms per brief, each one is a search
+BRIEF_TERMS = 5
+
+MAX_DEPTH = 5
+
+
+def file_hash(fpath: Path) -> str:
+    digest = hashlib.sha256()
+    with open(fpath, "rb") as file_object:
+        for block in iter(lambda: file_object.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def inputs_hash(*inputs: Any) -> str:
+    serialized = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def read_job(job_dir: Path) -> Dict[str, Any]:
+    fpath = job_dir / JOB_FILE
+    if not fpath.exists():
+        return {"steps": dict(), "items": dict()}
+    with open(fpath) as file_object:
+        job: Dict[str, Any] = json.load(file_object)
+    return job
+
+
+def write_job(job_dir: Path, job: Dict[str, Any]) -> None:
+    # written to a temporary file first, so an interrupted write never leaves a broken job file
+    temporary = job_dir / f"{JOB_FILE}.tmp"
+    with open(temporary, "w") as file_object:
+        json.dump(job, file_object, indent=2, ensure_ascii=False)
+    os.replace(temporary, job_dir / JOB_FILE)
+
+
+def run_step(job_dir: Path, job: Dict[str, Any], name: str, inputs: str, fpath: Path, step: Callable[[], Any]) -> str:
+    recorded = job["steps"].get(name)
+    if recorded and recorded["inputs"] == inputs and fpath.exists() and file_hash(fpath) == recorded["output"]:
+        fprint("info", f"skipping {name}, its inputs did not change since the last run")
+        return str(recorded["output"])
+    fprint("info", f"running {name}")
+    job["steps"].pop(name, None)
+    write_job(job_dir, job)
+    step()
+    job["steps"][name] = {"inputs": inputs, "output": file_hash(fpath)}
+    write_job(job_dir, job)
+    return str(job["steps"][name]["output"])
+
+
+def plan_briefs(cluster_path: Path, urlmap_path: Path, max_briefs: int) -> List[Tuple[str, str, List[str]]]:
+    clusters = pd.read_csv(cluster_path, index_col=0, dtype=str, keep_default_na=False)
+    mapped = pd.read_csv(urlmap_path, index_col=0, dtype=str, keep_default_na=False)
+    members = clusters.groupby("cluster")["keywords"].apply(list)
+    pages = dict(zip(mapped["keyword"], mapped["url"]))
+    briefs = list()
+    for exemplar in members.map(len).sort_values(ascending=False, kind="stable").index:
+        url = pages.get(exemplar)
+        if not url or url == UNMAPPED:
+            continue
+        terms = [i for i in members[exemplar] if i != exemplar][:BRIEF_TERMS]
+        briefs.append((url, exemplar, terms))
+    return briefs[:max_briefs]
+
+
+def write_briefs(job_dir: Path, job: Dict[str, Any], inputs: str, briefs: List[Tuple[str, str, List[str]]], location: str) -> None:
+    progress = job["items"].get("onpage")
+    if not progress or progress["inputs"] != inputs:
+        progress = {"inputs": inputs, "done": list()}
+        job["items"]["onpage"] = progress
+    pending = [(n, i) for n, i in enumerate(briefs, start=1) if i[1] not in progress["done"]]
+    if len(pending) < len(briefs):
+        fprint("info", f"resuming onpage, {len(briefs) - len(pending)} of {len(briefs)} briefs already written")
+    fdir = job_dir / "briefs"
+    fdir.mkdir(exist_ok=True)
+    for start in range(0, len(pending), BRIEF_CHUNK):
+        chunk = [i for _, i in pending[start : start + BRIEF_CHUNK]]
+        fpaths = [fdir / f"{n:03d}_{strip_domain(i[0])}.docx" for n, i in pending[start : start + BRIEF_CHUNK]]
+        for fpath in fpaths:
+            if fpath.exists():
+                fpath.unlink()
+        compile_onpage_batch(chunk, location, fpaths)
+        progress["done"].extend([i[1] for i, fpath in zip(chunk, fpaths) if fpath.exists()])
+        write_job(job_dir, job)
+
+
+def run_job(seeds: List[str], domain: str, location: str, database: str, cutoff: int, max_requests: int, rows: int, cut: List[str], max_briefs: int, job_dir: Path) -> None:
+    job_dir.mkdir(parents=True, exist_ok=True)
+    job = read_job(job_dir)
+    fprint("info", f"running job @ {job_dir}")
+    kwlist_path = job_dir / "kwlist.csv"
+    cluster_path = job_dir / "cluster.csv"
+    urlmap_path = job_dir / "urlmap.csv"
+    try:
+        kwlist_inputs = inputs_hash(seeds, location, cutoff, cut, max_requests)
+        kwlist_output = run_step(job_dir, job, "kwlist", kwlist_inputs, kwlist_path, lambda: get_kwlist(seeds, location, cutoff, kwlist_path, cut, MAX_DEPTH, max_requests))
+
+        def cluster_step() -> None:
+            kwset = list(pd.read_csv(kwlist_path, index_col=0, dtype=str, keep_default_na=False)["kwset"])
+            keywords = [i for i in dict.fromkeys([normalize_keyword(i) for i in seeds] + kwset) if i]
+            cluster_keywords(keywords, 0.9, cluster_path, "numpy", 1, "affinity", 0.25, False, None)
+
+        cluster_output = run_step(job_dir, job, "cluster", inputs_hash(kwlist_output, seeds), cluster_path, cluster_step)
+
+        def urlmap_step() -> None:
+            exemplars = list(pd.read_csv(cluster_path, index_col=0, dtype=str, keep_default_na=False)["cluster"].unique())
+            map_domain(domain, database, rows, exemplars, urlmap_path, False, cut, 20)
+
+        urlmap_output = run_step(job_dir, job, "urlmap", inputs_hash(cluster_output, domain, database, rows, cut), urlmap_path, urlmap_step)
+        briefs = plan_briefs(cluster_path, urlmap_path, max_briefs)
+        fprint("info", f"{len(briefs)} clusters mapped to pages of {domain}")
+        write_briefs(job_dir, job, inputs_hash(cluster_output, urlmap_output, location), briefs, location)
+    except KeyboardInterrupt:
+        fprint("warning", f"job interrupted, resume it with --job {job_dir}")
+        sys.exit()
+    fprint("info", f"job completed ~ find your output @ {job_dir}")
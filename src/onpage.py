@@ -4,6 +4,22 @@ On page optimization brief.
 This module collects metadata from a page and the SERPs for a set of search terms.
 It then constructs a content brief in .docx format contaning the the metadata.
 
+Each page is parsed once and its metadata is collected in a single walk over the document.
+Fields are extracted by the functions registered in EXTRACTORS, keyed by the tag they read from.
+
+Competitor pages are fetched concurrently, with at most a couple of connections per host and a timeout on every request.
+Competitors that cannot be fetched are skipped.
+
+Pages are streamed into the html parser as they download and only html content is read.
+Reading stops after --max-bytes, so very large pages are cut short, and with --head-only it stops as soon as the <body> starts.
+
+Fetched pages are kept in a local archive. The next fetch of a page asks the server whether it changed and reuses the archived copy when it did not.
+Use --offline to read pages only from the archive (reproducible runs without network access) or --no-archive to skip it.
+In offline mode the SERPs are read from the response cache only and the health checks are skipped.
+
+The --file option creates a brief for every row of a .csv file (url, primary term, secondary terms) - should not contain header row.
+The SERPs, pages and health checks shared between briefs are only collected once, and the briefs are written in parallel.
+
 References:
 
 > https://python-docx.readthedocs.io/en/latest/
@@ -11,147 +27,315 @@ References:
 > https://mlhive.com/2022/03/create-and-modify-word-docx-files-using-python-docx
 """
 
+import asyncio
+import codecs
+import csv
 import datetime
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 from statistics import mean
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import urlparse
 
+import lxml.etree
 import lxml.html
 import requests
-from docx import Document
-
-from src.apicalls import query_mobile_friendliness, query_pagespeed, query_valueserp
-from src.constants import USER_AGENT
+from lxml.html import HtmlElement
+
+from src.apicalls import collect_related, get_cached_valueserp, query_mobile_friendliness, query_pagespeed, query_valueserp_batch
+from src.archive import ArchivedPage, get_archived, get_validators, set_archived
+from src.archive import settings as archive_settings
+from src.authentication import reserve_api_credit
+from src.concurrency import run_blocking, run_concurrently, single_flight
+from src.constants import PAGE_MAX_BYTES, USER_AGENT
 from src.formatting import flatten_list, fprint
-from src.kwlist import collect_related
+from src.profiling import count, span
+from src.transport import get_session
 
-session = requests.Session()
+# connect and read timeouts in seconds
+PAGE_TIMEOUT = (5, 20)
 
+HOST_CONCURRENCY = 2
 
-def get_response(url: str) -> requests.Response:
-    fprint("info", f"fetching {url}")
+PAGE_CHUNK_BYTES = 64 * 1024
+
+HTML_CONTENT_TYPES = ["text/html", "application/xhtml+xml"]
+
+HEAD_FIELDS = ["titles", "descriptions", "canonical", "alternate_links", "hreflang", "meta_robots", "json_ld"]
+
+settings: Dict[str, int] = {"max_bytes": PAGE_MAX_BYTES}
+
+
+class Page(NamedTuple):
+    url: str
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    document: Optional[HtmlElement]
+    truncated: bool
+
+
+def configure_fetching(max_bytes: int) -> None:
+    settings.update({"max_bytes": max_bytes})
+
+
+def get_content_type(headers: Dict[str, str]) -> Tuple[str, Optional[str]]:
+    media_type, _, parameters = headers.get("content-type", "").partition(";")
+    charset = re.search(r"charset=[\"']?([\w.:-]+)", parameters)
+    return media_type.strip().lower(), charset.group(1) if charset and is_known_charset(charset.group(1)) else None
+
+
+def is_known_charset(charset: str) -> bool:
+    # an unknown charset (e.g., utf8mb4) would make the parser raise, the parser detects the encoding itself instead
     try:
-        response = session.get(url, headers=USER_AGENT)
-    except ConnectionError:
-        print("[error] connection error for the url")
-    if response and not response.content:
-        sys.exit("[error] no data found for the url")
-    return response
+        codecs.lookup(charset)
+    except LookupError:
+        return False
+    return True
+
+
+def parse_chunks(chunks: Iterator[bytes], charset: Optional[str], head_only: bool) -> Tuple[bytes, Optional[HtmlElement], bool]:
+    # the html is fed to the parser as it arrives, reading stops at the size cap or, for head metadata, at the <body> tag
+    parser = lxml.etree.HTMLPullParser(events=("start",), tag="body", encoding=charset)
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    content = bytearray()
+    truncated = False
+    for chunk in chunks:
+        chunk = chunk[: settings["max_bytes"] - len(content)]
+        content.extend(chunk)
+        parser.feed(chunk)
+        if any(parser.read_events()) and head_only:
+            break
+        if len(content) >= settings["max_bytes"]:
+            truncated = True
+            break
+    try:
+        document = parser.close() if content else None
+    except lxml.etree.LxmlError:
+        document = None
+    return bytes(content), document, truncated
+
+
+def get_response(url: str, head_only: bool = False) -> Page:
+    archived = get_archived(url)
+    if archive_settings["offline"]:
+        if archived is None:
+            fprint("warning", f"{url} is not in the page archive")
+            return Page(url, 0, dict(), b"", None, False)
+        return read_archived(url, archived, head_only)
+    fprint("info", f"fetching {url}")
+    headers = {**USER_AGENT, **get_validators(archived)}
+    count("pages.requests")
+    with span("fetch page", "pages", url=url), get_session().get(url, headers=headers, timeout=PAGE_TIMEOUT, stream=True) as response:
+        if response.status_code == 304 and archived is not None:
+            return read_archived(url, archived, head_only)
+        headers = {k.lower(): v for k, v in response.headers.items()}
+        media_type, charset = get_content_type(headers)
+        if media_type and media_type not in HTML_CONTENT_TYPES:
+            return Page(url, response.status_code, headers, b"", None, False)
+        content, document, truncated = parse_chunks(response.iter_content(PAGE_CHUNK_BYTES), charset, head_only)
+    count("pages.bytes", len(content))
+    if truncated:
+        fprint("warning", f"{url} is larger than {settings['max_bytes']} bytes, only the beginning of the page was read")
+    if not head_only and content:
+        set_archived(url, response.status_code, headers, content, truncated)
+    return Page(url, response.status_code, headers, content, document, truncated)
+
+
+def read_archived(url: str, archived: ArchivedPage, head_only: bool) -> Page:
+    fprint("info", f"reading {url} from the page archive")
+    count("pages.archive_hits")
+    _, charset = get_content_type(archived.headers)
+    content, document, truncated = parse_chunks(iter([archived.content]), charset, head_only)
+    return Page(url, archived.status_code, archived.headers, content, document, truncated or archived.truncated)
+
+
+def unusable_reason(page: Page) -> Optional[str]:
+    if page.status_code == 0:
+        return "not in the page archive"
+    media_type, _ = get_content_type(page.headers)
+    if media_type and media_type not in HTML_CONTENT_TYPES:
+        return f"unsupported content type {media_type}"
+    if not page.content:
+        return "no data found"
+    if page.document is None:
+        return "unreadable html"
+    return None
+
+
+def get_titles(element: HtmlElement) -> List[str]:
+    return [i.strip() for i in element.itertext()]
+
 
+def get_descriptions(element: HtmlElement) -> List[str]:
+    if element.get("name") == "description" and element.get("content") is not None:
+        return [element.get("content").strip()]
+    return []
 
-def get_titles(response: requests.Response) -> List[str]:
-    html = lxml.html.fromstring(response.content)
-    title_list = html.xpath("//title//text()")
-    return [i.strip() for i in title_list]
 
+def get_h1s(element: HtmlElement) -> List[str]:
+    return [i.strip() for i in element.itertext()]
 
-def get_descriptions(response: requests.Response) -> List[str]:
-    html = lxml.html.fromstring(response.content)
-    description_list = html.xpath("//meta[@name='description']/@content")
-    return [i.strip() for i in description_list]
 
+def get_h2s(element: HtmlElement) -> List[str]:
+    return [i.strip() for i in element.itertext()]
 
-def get_h1s(response: requests.Response) -> List[str]:
-    html = lxml.html.fromstring(response.content)
-    h1_list = html.xpath(".//h1//text()")
-    return [i.strip() for i in h1_list]
 
+def get_canonical_link(element: HtmlElement) -> List[str]:
+    if element.get("rel") == "canonical" and element.get("href") is not None:
+        return [element.get("href")]
+    return []
 
-def get_h2s(response: requests.Response) -> List[str]:
-    html = lxml.html.fromstring(response.content)
-    h2_list = html.xpath("//h2//text()")
-    return [i.strip() for i in h2_list]
 
+def get_alternate_links(element: HtmlElement) -> List[str]:
+    if element.get("rel") == "alternate" and element.get("href") is not None:
+        return [element.get("href")]
+    return []
 
-def get_canonical_link(response: requests.Response) -> Any:
-    html = lxml.html.fromstring(response.content)
-    return html.xpath("//link[@rel='canonical']/@href")
 
+def get_hreflang(element: HtmlElement) -> List[str]:
+    if element.get("rel") == "alternate" and element.get("hreflang") is not None:
+        return [element.get("hreflang")]
+    return []
 
-def get_alternate_links(response: requests.Response) -> Any:
-    html = lxml.html.fromstring(response.content)
-    return html.xpath("//link[@rel='alternate']/@href")
 
+def get_links(element: HtmlElement) -> List[str]:
+    return [element.get("href")] if element.get("href") is not None else []
 
-def get_hreflang(response: requests.Response) -> Any:
-    html = lxml.html.fromstring(response.content)
-    return html.xpath("//link[@rel='alternate']/@hreflang")
 
+def get_image_links(element: HtmlElement) -> List[str]:
+    return [element.get("src")] if element.get("src") is not None else []
 
-def get_links(response: requests.Response) -> Any:
-    html = lxml.html.fromstring(response.content)
-    return html.xpath("//@href")
 
+def get_metarobots(element: HtmlElement) -> List[str]:
+    if element.get("name") == "robots" and element.get("content") is not None:
+        return [element.get("content")]
+    return []
 
-def get_image_links(response: requests.Response) -> Any:
-    html = lxml.html.fromstring(response.content)
-    return html.xpath("//img/@src")
 
+def get_paragraphs(element: HtmlElement) -> List[str]:
+    return list(element.itertext())
 
-def get_metarobots(response: requests.Response) -> Any:
-    html = lxml.html.fromstring(response.content)
-    return html.xpath("//meta[@name='robots']/@content")
 
+def get_jsonld(element: HtmlElement) -> List[str]:
+    if element.get("type") == "application/ld+json":
+        return list(element.itertext())
+    return []
 
-def get_paragraphs(response: requests.Response) -> Any:
-    html = lxml.html.fromstring(response.content)
-    return html.xpath("//p//text()")
 
+# field name -> (tag the extractor runs on, None for every element, extractor)
+EXTRACTORS: Dict[str, Tuple[Optional[str], Callable[[HtmlElement], List[str]]]] = {
+    "titles": ("title", get_titles),
+    "descriptions": ("meta", get_descriptions),
+    "h1s": ("h1", get_h1s),
+    "h2s": ("h2", get_h2s),
+    "canonical": ("link", get_canonical_link),
+    "alternate_links": ("link", get_alternate_links),
+    "hreflang": ("link", get_hreflang),
+    "links": (None, get_links),
+    "image_links": ("img", get_image_links),
+    "meta_robots": ("meta", get_metarobots),
+    "paragraphs": ("p", get_paragraphs),
+    "json_ld": ("script", get_jsonld),
+}
 
-def get_wordcount(response: requests.Response) -> int:
-    title = " ".join(get_titles(response))
-    h1s = " ".join(get_h1s(response))
-    h2s = " ".join(get_h2s(response))
-    paragraphs = " ".join(get_paragraphs(response))
+
+def extract_fields(html: HtmlElement) -> Dict[str, List[str]]:
+    # a single walk over the parsed document, every element is handed to the extractors registered for its tag
+    fields: Dict[str, List[str]] = {name: list() for name in EXTRACTORS}
+    by_tag: Dict[Optional[str], List[Tuple[str, Callable[[HtmlElement], List[str]]]]] = dict()
+    for name, (tag, extractor) in EXTRACTORS.items():
+        by_tag.setdefault(tag, list()).append((name, extractor))
+    every = by_tag.get(None, [])
+    for element in html.iter(lxml.etree.Element):
+        for name, extractor in by_tag.get(element.tag, []) + every:
+            fields[name].extend(extractor(element))
+    return fields
+
+
+def get_wordcount(fields: Dict[str, List[str]]) -> int:
+    title = " ".join(fields["titles"])
+    h1s = " ".join(fields["h1s"])
+    h2s = " ".join(fields["h2s"])
+    paragraphs = " ".join(fields["paragraphs"])
     all_text = title + h1s + h2s + paragraphs
     return len(all_text.split())
 
 
-def get_jsonld(response: requests.Response) -> Any:
-    html = lxml.html.fromstring(response.content)
-    jsonscripts = html.xpath("//script[@type='application/ld+json']//text()")
-    if jsonscripts:
-        return jsonscripts[0].replace("\t", "")
-    else:
-        return
+def extract_metadata(html: HtmlElement) -> Dict[str, Any]:
+    fields = extract_fields(html)
+    metadata: Dict[str, Any] = {name: fields[name] for name in EXTRACTORS if name not in ["paragraphs", "json_ld"]}
+    metadata["json_ld"] = fields["json_ld"][0].replace("\t", "") if fields["json_ld"] else None
+    metadata["wordcount"] = get_wordcount(fields)
+    return metadata
 
 
-def get_page_metadata(url: str) -> Dict[str, Any]:
-    fprint("info", f"collecting page metadata for {url}")
-    metadata = dict()
-    response = get_response(url)
-    metadata.update(
-        {
-            "status_code": response.status_code,
-            "titles": get_titles(response),
-            "descriptions": get_descriptions(response),
-            "h1s": get_h1s(response),
-            "h2s": get_h2s(response),
-            "canonical": get_canonical_link(response),
-            "alternate_links": get_alternate_links(response),
-            "hreflang": get_hreflang(response),
-            "links": get_links(response),
-            "image_links": get_image_links(response),
-            "meta_robots": get_metarobots(response),
-            "json_ld": get_jsonld(response),
-            "wordcount": get_wordcount(response),
-        }
-    )
+def build_page_metadata(page: Page, head_only: bool = False) -> Dict[str, Any]:
+    metadata: Dict[str, Any] = {"status_code": page.status_code}
+    with span("extract metadata", "parse", url=page.url):
+        extracted = extract_metadata(page.document)
+    metadata.update({k: v for k, v in extracted.items() if k in HEAD_FIELDS or not head_only})
     return metadata
 
 
+def get_page_metadata(url: str, head_only: bool = False) -> Dict[str, Any]:
+    fprint("info", f"collecting page metadata for {url}")
+    try:
+        page = get_response(url, head_only)
+    except requests.RequestException as error:
+        fprint("error", f"could not fetch {url} ({type(error).__name__})")
+        sys.exit()
+    reason = unusable_reason(page)
+    if reason:
+        fprint("error", f"{reason} for {url}")
+        sys.exit()
+    return build_page_metadata(page, head_only)
+
+
+async def fetch_page(url: str, hosts: Dict[str, asyncio.Semaphore]) -> Page:
+    async with hosts.setdefault(urlparse(url).netloc, asyncio.Semaphore(HOST_CONCURRENCY)):
+        return await run_blocking(get_response, url)
+
+
+async def fetch_page_metadata(url: str, hosts: Dict[str, asyncio.Semaphore]) -> Optional[Dict[str, Any]]:
+    # a page that cannot be fetched or parsed is skipped, it should not abort the whole brief
+    try:
+        page = await single_flight("pages", url, partial(fetch_page, url, hosts))
+        reason = unusable_reason(page)
+        if reason:
+            fprint("warning", f"skipping {url} ({reason})")
+            return None
+        return build_page_metadata(page)
+    except Exception as error:
+        fprint("warning", f"skipping {url} ({type(error).__name__})")
+        return None
+
+
+def get_pages_metadata(urls: List[str]) -> List[Optional[Dict[str, Any]]]:
+    hosts: Dict[str, asyncio.Semaphore] = dict()
+    return run_concurrently([partial(fetch_page_metadata, i, hosts) for i in urls])
+
+
 def strip_domain(url: str) -> str:
     # strip domain and use it to create the fpath name together with the uuid
-    pass
+    parsed = urlparse(url)
+    name = f"{parsed.netloc.replace('www.', '', 1)}{parsed.path}"
+    return re.sub(r"[^0-9a-zA-Z]+", "-", name).strip("-")
 
 
 #    for i in pagedata["titles"]:
 #        document.add_paragraph(i, style="List Bullet")
 
 
-def create_brief(url, term, terms, pagedata, serpsdata, fpath):
-    document = Document()
+def create_brief(url: str, term: str, terms: List[str], pagedata: Dict[str, Any], serpsdata: Dict[str, Any], fpath: Path) -> None:
+    # python-docx takes a while to import, it is only loaded when a brief is written
+    from docx import Document
+
+    # python-docx is only partly typed, depending on its version
+    document: Any = Document()
     section = document.sections[0]
     header = section.header
     header.paragraphs[0].text = url
@@ -188,16 +372,16 @@ def create_brief(url, term, terms, pagedata, serpsdata, fpath):
     p.add_run("Recommended Structured Data: ").bold = True
     p = document.add_paragraph()
     p.add_run("Recommended Word Count: ").bold = True
-    p.add_run(f"{round(mean(serpsdata['wordcounts']))}")
+    p.add_run(f"{round(mean(serpsdata['wordcounts'])) if serpsdata['wordcounts'] else 'n/a'}")
     document.add_page_break()
     document.add_heading("Technical Health Checks", 1)
     document.add_paragraph()
     p = document.add_paragraph()
     p.add_run("Mobile Friendliness: ").bold = True
-    p.add_run(f"{query_mobile_friendliness(url)}")
+    p.add_run(f"{pagedata['mobile_friendliness']}")
     p = document.add_paragraph()
     p.add_run("Page Speed: ").bold = True
-    p.add_run(f"{query_pagespeed(url)}")
+    p.add_run(f"{pagedata['page_speed']}")
     document.add_page_break()
     document.add_heading("Search Intent & Value Assessment", 1)
     document.add_paragraph()
@@ -252,43 +436,120 @@ def create_brief(url, term, terms, pagedata, serpsdata, fpath):
     document.save(fpath)
 
 
-def compile_onpage(url, term, terms, location, fpath):
-    fprint("info", f"running onpage analysis for {url} - location: {location}")
-    if terms:
-        terms.append(term)
-        queries = [t.replace(" ", "+") for t in terms]
+def get_queries(term: str, terms: Optional[List[str]]) -> List[str]:
+    # queries are written the same way in every brief, so briefs sharing a query search it once
+    # spaces are kept as they are, the query string is url encoded when the request is sent
+    return [" ".join(t.split()) for t in (terms or []) + [term]]
+
+
+def read_briefs(lines: List[str]) -> List[Tuple[str, str, List[str]]]:
+    briefs = list()
+    for row in csv.reader(lines):
+        row = [i.strip() for i in row if i.strip()]
+        if len(row) < 2:
+            fprint("warning", f"skipping brief without url and term: {','.join(row)}")
+            continue
+        briefs.append((row[0], row[1], row[2:]))
+    return briefs
+
+
+async def fetch_health_check(url: str, name: str, check: Callable[[str], Any]) -> Any:
+    # a failed check is reported in the brief, it should not abort the other briefs of the batch
+    try:
+        return await run_blocking(check, url)
+    except Exception as error:
+        fprint("warning", f"could not collect {name} for {url} ({type(error).__name__})")
+        return "n/a"
+
+
+async def fetch_health_checks(url: str) -> Tuple[Any, Any]:
+    mobile_friendliness = await fetch_health_check(url, "mobile friendliness", query_mobile_friendliness)
+    page_speed = await fetch_health_check(url, "page speed", query_pagespeed)
+    return mobile_friendliness, page_speed
+
+
+def collect_serps(queries: List[str], location: str) -> Dict[str, Dict[str, Any]]:
+    if not archive_settings["offline"]:
+        reserve_api_credit("valueserp", len(queries))
+        return dict(zip(queries, query_valueserp_batch(queries, location)))
+    # offline, serps are only read from the response cache
+    serps = dict()
+    for query in queries:
+        cached = get_cached_valueserp(query, location)
+        if cached is None:
+            fprint("warning", f"no serps for {query} in the response cache")
+        serps[query] = cached or dict()
+    return serps
+
+
+def compile_onpage_batch(briefs: List[Tuple[str, str, List[str]]], location: str, fpaths: List[Path]) -> List[Dict[str, Any]]:
+    # all serps, pages and health checks the briefs need are planned up front, so work shared between briefs runs once
+    queries = [get_queries(term, terms) for _, term, terms in briefs]
+    unique_queries = list(dict.fromkeys(flatten_list(queries)))
+    fprint("info", f"collecting serps for {len(unique_queries)} queries across {len(briefs)} briefs - location: {location}")
+    serps = collect_serps(unique_queries, location)
+    competitors = list()
+    for brief_queries in queries:
+        links = [i["link"] for q in brief_queries for i in serps[q].get("organic_results", []) if "domain" in i]
+        competitors.append(links)
+    urls = list(dict.fromkeys([url for url, _, _ in briefs]))
+    pages = list(dict.fromkeys(urls + flatten_list(competitors)))
+    fprint("info", f"collecting page metadata for {len(pages)} pages")
+    metadata = dict(zip(pages, get_pages_metadata(pages)))
+    checked = [i for i in urls if metadata[i] is not None]
+    if archive_settings["offline"]:
+        fprint("warning", "health checks need network access, they are skipped in offline mode")
+        health_checks = {i: ("n/a", "n/a") for i in checked}
     else:
-        queries = [term]
-    organic_results = list()
-    for i in queries:
-        fprint("info", f"collecting serps for {i}")
-        serps = query_valueserp(i, location).json()
-        related_results = collect_related(serps)
-        for i in serps["organic_results"]:
-            if "domain" in i:
-                organic_results.append(i["link"])
-    page_metadata = get_page_metadata(url)
-    page_metadata.update({"related_searches": related_results})
-    serps_metadata = dict()
-    serps_titles = list()
-    serps_descriptions = list()
-    serps_h1s = list()
-    serps_h2s = list()
-    serps_wordcounts = list()
-    for i in organic_results:
-        metadata = get_page_metadata(i)
-        serps_titles.append(metadata["titles"])
-        serps_descriptions.append(metadata["descriptions"])
-        serps_h1s.append(metadata["h1s"])
-        serps_h2s.append(metadata["h2s"])
-        serps_wordcounts.append(metadata["wordcount"])
-    serps_metadata = {
-        "urls": organic_results,
-        "titles": flatten_list(serps_titles),
-        "descriptions": flatten_list(serps_descriptions),
-        "h1s": flatten_list(serps_h1s),
-        "h2s": flatten_list(serps_h2s),
-        "wordcounts": serps_wordcounts,
-    }
-    create_brief(url, term, queries, page_metadata, serps_metadata, fpath)
-    return {"page_metadata": page_metadata, "serps_metadata": serps_metadata}
+        health_checks = dict(zip(checked, run_concurrently([partial(fetch_health_checks, i) for i in checked])))
+    results = list()
+    renders = list()
+    for (url, term, _), brief_queries, organic_results, fpath in zip(briefs, queries, competitors, fpaths):
+        if metadata[url] is None:
+            fprint("error", f"could not collect page metadata for {url}, skipping its brief")
+            continue
+        page_metadata = dict(metadata[url])
+        page_metadata.update({"related_searches": collect_related(serps[brief_queries[-1]])})
+        page_metadata.update({"mobile_friendliness": health_checks[url][0], "page_speed": health_checks[url][1]})
+        serps_titles = list()
+        serps_descriptions = list()
+        serps_h1s = list()
+        serps_h2s = list()
+        serps_wordcounts = list()
+        for i in organic_results:
+            if metadata[i] is None:
+                continue
+            serps_titles.append(metadata[i]["titles"])
+            serps_descriptions.append(metadata[i]["descriptions"])
+            serps_h1s.append(metadata[i]["h1s"])
+            serps_h2s.append(metadata[i]["h2s"])
+            serps_wordcounts.append(metadata[i]["wordcount"])
+        serps_metadata = {
+            "urls": organic_results,
+            "titles": flatten_list(serps_titles),
+            "descriptions": flatten_list(serps_descriptions),
+            "h1s": flatten_list(serps_h1s),
+            "h2s": flatten_list(serps_h2s),
+            "wordcounts": serps_wordcounts,
+        }
+        renders.append((url, term, brief_queries, page_metadata, serps_metadata, fpath))
+        results.append({"page_metadata": page_metadata, "serps_metadata": serps_metadata})
+    fprint("info", f"writing {len(renders)} briefs")
+    if len(renders) > 1:
+        with span("write briefs", "output", briefs=len(renders)), ProcessPoolExecutor() as executor:
+            for f in [executor.submit(create_brief, *i) for i in renders]:
+                f.result()
+    for render in renders:
+        if len(renders) == 1:
+            with span("write briefs", "output", briefs=1):
+                create_brief(*render)
+        fprint("info", f"brief for {render[0]} completed ~ find your output @ {render[-1]}")
+    return results
+
+
+def compile_onpage(url: str, term: str, terms: Optional[List[str]], location: str, fpath: Path) -> Dict[str, Any]:
+    fprint("info", f"running onpage analysis for {url} - location: {location}")
+    results = compile_onpage_batch([(url, term, terms or [])], location, [fpath])
+    if not results:
+        sys.exit()
+    return results[0]
@@ -0,0 +1,111 @@
+"""
+Profile a command run.
+
+With --profile, the commands record timed spans (api calls, credit checks, page fetches, html parsing, distance computation, output writing) and counters (requests, bytes transferred, cache hits).
+At the end of the run a summary table is printed and the spans are written as a Chrome trace, which can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+Without --profile, a span is a shared no-op context manager and a counter update is a single check, so the instrumentation costs next to nothing.
+
+References:
+
+> https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Dict, List, Optional, Tuple
+
+settings: Dict[str, Any] = {"enabled": False, "start": 0.0}
+
+events: List[Dict[str, Any]] = list()
+
+counters: Dict[str, int] = Counter()
+
+tracks: Dict[int, int] = dict()
+
+lock = threading.Lock()
+
+disabled = nullcontext()
+
+
+class Span:
+    def __init__(self, name: str, category: str, arguments: Dict[str, Any]) -> None:
+        self.name = name
+        self.category = category
+        self.arguments = arguments
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception: Any) -> None:
+        end = time.perf_counter()
+        event = {
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": (self.start - settings["start"]) * 1e6,
+            "dur": (end - self.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": get_track(),
+            "args": self.arguments,
+        }
+        with lock:
+            events.append(event)
+
+
+def configure_profiling(enabled: bool) -> None:
+    settings.update({"enabled": enabled, "start": time.perf_counter()})
+
+
+def get_track() -> int:
+    # concurrent asyncio tasks share a thread, each task gets its own track in the trace so their spans do not overlap
+    task = None
+    if "asyncio" in sys.modules:
+        try:
+            task = sys.modules["asyncio"].current_task()
+        except RuntimeError:
+            task = None
+    key = id(task) if task is not None else threading.get_ident()
+    with lock:
+        return tracks.setdefault(key, len(tracks) + 1)
+
+
+def span(name: str, category: str, **arguments: Any) -> ContextManager[Optional[Span]]:
+    if not settings["enabled"]:
+        return disabled
+    return Span(name, category, arguments)
+
+
+def count(name: str, value: int = 1) -> None:
+    if settings["enabled"]:
+        with lock:
+            counters[name] += value
+
+
+def summarize_spans() -> List[Tuple[str, int, float, float]]:
+    totals: Dict[str, List[float]] = dict()
+    for event in events:
+        totals.setdefault(f"{event['cat']}: {event['name']}", list()).append(event["dur"] / 1e6)
+    rows = [(name, len(durations), sum(durations), max(durations)) for name, durations in totals.items()]
+    return sorted(rows, key=lambda x: x[2], reverse=True)
+
+
+def write_profile(fpath: Path) -> None:
+    wall = time.perf_counter() - settings["start"]
+    trace = {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"wall_seconds": wall, "counters": dict(counters)}}
+    with open(fpath, "w") as file_object:
+        json.dump(trace, file_object)
+    print(f"\n{'span':<40} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}")
+    for name, calls, total, longest in summarize_spans():
+        print(f"{name:<40} {calls:>8} {total:>10.3f} {total / calls * 1000:>10.1f} {longest * 1000:>10.1f}")
+    print(f"\n{'counter':<40} {'value':>8}")
+    for name, value in sorted(counters.items()):
+        print(f"{name:<40} {value:>8}")
+    print(f"\nwall time {wall:.3f}s, profile written to {fpath}\n")
@@ -0,0 +1,59 @@
+"""
+Shared HTTP transport.
+
+Every API call and page fetch goes through the same connection pool, so connections (and TLS sessions) are kept alive and reused across calls.
+The pool holds one connection per worker thread for each host, requests without an explicit timeout get default connect and read timeouts.
+Responses are requested gzip or brotli compressed, brotli is only offered when the brotli package is installed.
+
+requests sessions are not guaranteed to be thread safe, each thread gets its own session on top of the shared (thread safe) connection pool.
+
+References:
+
+> https://requests.readthedocs.io/en/latest/user/advanced/#transport-adapters
+> https://urllib3.readthedocs.io/en/stable/advanced-usage.html#customizing-pool-behavior
+"""
+
+import threading
+from typing import Any, Dict, cast
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from src.concurrency import settings as concurrency_settings
+
+# connect and read timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+
+# hosts with a connection pool kept open, competitor pages come from many different hosts
+POOL_HOSTS = 64
+
+adapters: Dict[str, HTTPAdapter] = dict()
+
+local = threading.local()
+
+lock = threading.Lock()
+
+
+class Session(requests.Session):
+    def request(self, method: str, url: str, *args: Any, **kwargs: Any) -> requests.Response:  # type: ignore[override]
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, *args, **kwargs)
+
+
+def get_adapter() -> HTTPAdapter:
+    # created on first use, once the concurrency ceiling (and so the number of worker threads) is configured
+    with lock:
+        if "adapter" not in adapters:
+            adapters["adapter"] = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=concurrency_settings["ceiling"])
+        return adapters["adapter"]
+
+
+def get_session() -> requests.Session:
+    if not hasattr(local, "session"):
+        session = Session()
+        session.mount("https://", get_adapter())
+        session.mount("http://", get_adapter())
+        session.headers.update({"Accept-Encoding": ACCEPT_ENCODING})
+        local.session = session
+    return cast(requests.Session, local.session)
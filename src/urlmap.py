@@ -10,10 +10,14 @@ The page score is computed using Search Volume, CTR and (keyword) Position.
 
 > score = (search volume * ctr) / position
 
-Only keywords for which the domain ranks between position 1 to 20 are mapped.
+The CTR of the top twenty positions comes from observed click-through rates.
+Past position twenty the CTR is extrapolated from a power law curve fitted on those observed values.
+
+Only keywords for which the domain ranks between position 1 to 20 are mapped, use --max-position to map lower rankings too.
 
 The rows option determines how many rows to retrieve from the SEMRush database.
 This can be useful to test the output or save SEMRush credits.
+Large reports are requested in pages of a few thousand rows, several pages at a time, and filtered page by page.
 
 When providing a file with keywords, it is mapped against all the keywords in the database.
 The output always contains the SEMRush data as well, use --no-semrush to skip that data.
@@ -26,86 +30,119 @@ Either way, the algorithm recommends creating new content to target the keyword.
 The --remove option can be used to filter the SEMRush data.
 Patterns with slashes e.g., '/path' or '/path/' will exclude pages containing the 'path'.
 Patterns without slashes e.g., 'term' will exclude keywords containing the 'term'.
+Patterns are matched literally, characters like '.' or '+' have no special meaning.
 """
 
 import io
 import sys
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 
-from src.apicalls import query_semrush
+from src.apicalls import query_semrush_pages
+from src.authentication import reserve_api_credit
+from src.filtering import compile_exclusions, exclude_rows
 from src.formatting import fprint
-
-
-def set_score(data: pd.DataFrame) -> pd.DataFrame:
-    # FIXME: see if it'd be possible to model the ctr distribution to generate expected ctr values past the top twenty positions
-    ctr = {
-        1: 0.329,
-        2: 0.1534,
-        3: 0.0897,
-        4: 0.0594,
-        5: 0.0417,
-        6: 0.0305,
-        7: 0.0228,
-        8: 0.0177,
-        9: 0.0143,
-        10: 0.0117,
-        11: 0.0101,
-        12: 0.01,
-        13: 0.0104,
-        14: 0.0104,
-        15: 0.01,
-        16: 0.0089,
-        17: 0.0084,
-        18: 0.0075,
-        19: 0.0072,
-        20: 0.0064,
-    }
-    data["position"] = round(data["position"], 0)
-    data["search volume"] = round(data["search volume"], 0)
-    data["ctr"] = round(data["position"].map(ctr).fillna(0), 2)
-    data["score"] = round((data["search volume"] * data["ctr"]) / data["position"], 2)
-    pairs = data.groupby("keyword").head(1).sort_values("score", ascending=False)
-    output = pairs[(pairs["position"].isnull()) | (pairs["position"] <= 20)].copy()
-    output["url"].fillna("unmapped - create new page", inplace=True)
+from src.profiling import span
+
+MAX_POSITION = 100
+
+UNMAPPED = "unmapped - create new page"
+
+CTR = {
+    1: 0.329,
+    2: 0.1534,
+    3: 0.0897,
+    4: 0.0594,
+    5: 0.0417,
+    6: 0.0305,
+    7: 0.0228,
+    8: 0.0177,
+    9: 0.0143,
+    10: 0.0117,
+    11: 0.0101,
+    12: 0.01,
+    13: 0.0104,
+    14: 0.0104,
+    15: 0.01,
+    16: 0.0089,
+    17: 0.0084,
+    18: 0.0075,
+    19: 0.0072,
+    20: 0.0064,
+}
+
+CTR_TABLE: Dict[str, np.ndarray[Any, Any]] = dict()
+
+
+def expected_ctr_table() -> np.ndarray[Any, Any]:
+    # observed ctr for the top twenty positions, a power law fitted on them (ctr = a * position ^ -b) for the positions after
+    if "table" not in CTR_TABLE:
+        positions = np.array(list(CTR.keys()), dtype=float)
+        observed = np.array(list(CTR.values()))
+        slope, intercept = np.polyfit(np.log(positions), np.log(observed), 1)
+        table = np.zeros(MAX_POSITION + 1)
+        table[1:] = np.exp(intercept) * np.arange(1, MAX_POSITION + 1, dtype=float) ** slope
+        table[positions.astype(int)] = observed
+        CTR_TABLE["table"] = table
+    return CTR_TABLE["table"]
+
+
+def expected_ctr(positions: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+    table = expected_ctr_table()
+    ranked = np.isfinite(positions) & (positions >= 1)
+    index = np.clip(np.nan_to_num(np.round(positions), nan=0.0), 0, MAX_POSITION).astype(np.int64)
+    return np.where(ranked, table[index], 0.0)
+
+
+def set_score(data: pd.DataFrame, max_position: int) -> pd.DataFrame:
+    position = np.round(data["position"].to_numpy(dtype=float))
+    volume = np.round(data["search volume"].to_numpy(dtype=float))
+    ctr = expected_ctr(position)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = volume * ctr / position
+    data = data.assign(**{"position": position, "search volume": volume, "ctr": np.round(ctr, 4), "score": np.round(score, 2)})
+    pairs = data.sort_values("score", ascending=False, kind="stable").drop_duplicates("keyword")
+    output = pairs[(pairs["position"].isnull()) | (pairs["position"] <= max_position)]
+    output = output.assign(url=output["url"].fillna(UNMAPPED))
     return output.reset_index(drop=True)
 
 
-def map_domain(domain: str, database: str, rows: int, upload: str, fpath: Path, semrush: bool, cut: List[str]) -> pd.DataFrame:
+def map_domain(domain: str, database: str, rows: int, upload: Optional[List[str]], fpath: Path, semrush: bool, cut: List[str], max_position: int) -> pd.DataFrame:
     if any(x in domain for x in ["http", "www"]):
         fprint("error", "domain should not contain http(s) or www")
         sys.exit()
     fprint("info", f"mapping keywords to {domain} - location: {database}")
-    response = query_semrush(domain, database, rows)
-    if "NOTHING" in response.text:
+    reserve_api_credit("semrush", rows)
+    exclusions = compile_exclusions(cut)
+    pages = list()
+    for text in query_semrush_pages(domain, database, rows):
+        if "NOTHING" in text:
+            break
+        page = pd.read_csv(io.StringIO(text), header=0, sep=";")
+        page.columns = page.columns.str.lower()
+        pages.append(exclude_rows(page, exclusions))
+        fprint("info", f"collected {sum([len(i) for i in pages])} rows from semrush")
+    if not pages:
         empty_data = pd.DataFrame(columns=["keyword"])
         empty_data.to_csv(fpath)
         fprint("error", f"no data found in semrush for {domain}")
         sys.exit()
-    api_data = pd.read_csv(io.StringIO(response.text), header=0, sep=";")
-    api_data.columns = api_data.columns.str.lower()
-    if cut:
-        regex_paths = "|".join([i.replace("/", "") for i in cut if "/" in i])
-        regex_keywords = "|".join([i for i in cut if "/" not in i])
-        cut_paths = regex_paths if regex_paths != "" else None
-        cut_keywords = regex_keywords if regex_keywords != "" else None
-        if cut_paths:
-            api_data = api_data.loc[~api_data["url"].str.contains(cut_paths)]
-        if cut_keywords:
-            api_data = api_data.loc[~api_data["keyword"].str.contains(cut_keywords)]
+    api_data = pd.concat(pages, ignore_index=True)
     mapped = pd.DataFrame()
     if upload:
         upload_data = pd.DataFrame(upload, columns=["keyword"])
         merged = upload_data.merge(api_data, on="keyword", how="outer", indicator=True)
-        mapped = set_score(merged)
+        mapped = set_score(merged, max_position)
         if semrush is False:
             mapped = mapped[mapped["_merge"].str.contains("both|left_only")]
     else:
-        mapped = set_score(api_data)
+        mapped = set_score(api_data, max_position)
     if "_merge" in mapped:
         mapped.drop(columns=["_merge"], inplace=True)
-    mapped.to_csv(fpath)
+    with span("write csv", "output", rows=len(mapped)):
+        mapped.to_csv(fpath)
     fprint("info", f"mapping completed ~ find your output @ {fpath}")
     return mapped.fillna(0)